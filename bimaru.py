@@ -6,21 +6,40 @@
 # 103432 Lourenco Matos
 # 102932 Martim Mendes
 
+import argparse
+import copy
+import functools
+import itertools
+import multiprocessing
+import os
+import queue
+import random
 import sys
+from collections import Counter, namedtuple
+from concurrent.futures import ProcessPoolExecutor
 
 import numpy as np
-import copy
 
+from exact_cover import ExactCover
+from heuristics import ESTIMATORS, Heuristic
+from profiling import SuiteProfile, profile_call
+from sat import CNF, SATSolver
 from search import (
     Problem,
     Node,
+    LeanNode,
+    TelemetryProblem,
     astar_search,
     breadth_first_tree_search,
+    depth_first_backtracking_search,
     depth_first_tree_search,
+    depth_first_tree_solutions,
+    conflict_directed_search,
     greedy_search,
     recursive_best_first_search,
     uniform_cost_search,
-    iterative_deepening_search
+    iterative_deepening_search,
+    parallel_depth_first_search
 )
 
 Battleship = 4
@@ -30,54 +49,285 @@ Submarine = 1
 
 
 class BimaruState:
+    __slots__ = ("board", "last", "id")
     state_id = 0
 
-    def __init__(self, board):
+    def __init__(self, board, last: int = None):
         self.board = board
+        # placement da ultima acao, usado na ramificacao canonica (ver Bimaru.actions); None fora dela,
+        # para que estados com o mesmo tabuleiro sejam iguais qualquer que seja a ordem das acoes
+        self.last = last
         self.id = BimaruState.state_id
         BimaruState.state_id += 1
 
     def __lt__(self, other):
         return self.id < other.id
 
+    def key(self):
+        """Identifica o conteudo do estado (ver Board.key), sem guardar o tabuleiro."""
+        return self.last, self.board.key()
+
     def __eq__(self, other):
+        """Dois estados sao iguais se os seus tabuleiros tiverem as mesmas pecas,
+        independentemente da ordem pela qual foram colocadas."""
         if isinstance(other, BimaruState):
-            return self.id == other.id and self.board == other.board
+            return self.last == other.last and self.board == other.board
         return False
 
     def __hash__(self):
-        return self.id
+        return hash(self.board) ^ hash(self.last)
 
     def __str__(self):
         return f"BimaruState: {self.id}, Board: \n{str(self.board)}"
 
 
-class Board:
-    """Representação interna de um tabuleiro de Bimaru."""
+################################################ BITBOARD MASKS ########################################################
+# Cada celula (row, col) corresponde ao bit row * size + col de um inteiro.
+
+BOARD_SIZE = 10
+FLEET = {Battleship: 1, Cruiser: 2, Destroyer: 3, Submarine: 4}
+
+PIECES = ("w", "c", "t", "b", "l", "r", "m")
+
+# linha que separa as instancias de uma stream com varias instancias (ver Board.stream_instances)
+INSTANCE_DELIMITER = "---"
+
+# Cada placement (comprimento, orientacao, origem) e identificado pelo seu indice em Geometry.placements,
+# e os conjuntos de placements sao bitmasks sobre esses indices.
+Placement = namedtuple("Placement", "action length cells halo rows cols pieces")
+
+
+def iter_cells(mask: int):
+    """Yield the index of every cell set in the mask."""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+# SPREAD[byte]: os 8 bits de byte nos bits pares de 2 bytes; COMPACT[byte]: os bits pares de byte juntos em 4 bits
+SPREAD = [sum((byte >> bit & 1) << 2 * bit for bit in range(8)).to_bytes(2, "little") for byte in range(256)]
+COMPACT = [sum((byte >> 2 * bit & 1) << bit for bit in range(4)) for byte in range(256)]
+
+
+def spread_bits(mask: int, nbytes: int) -> int:
+    """O bit i da mask (de nbytes bytes) passa a ser o bit 2 * i."""
+    return int.from_bytes(b"".join(map(SPREAD.__getitem__, mask.to_bytes(nbytes, "little"))), "little")
+
+
+def compact_bits(value: int, nbytes: int) -> int:
+    """Inversa de spread_bits: o bit 2 * i de value passa a ser o bit i."""
+    data = value.to_bytes(2 * nbytes, "little")
+    return int.from_bytes(bytes(COMPACT[data[i]] | COMPACT[data[i + 1]] << 4 for i in range(0, 2 * nbytes, 2)),
+                          "little")
+
+
+def window_all(array: np.ndarray, length: int, axis: int) -> np.ndarray:
+    """Para cada janela de length posicoes seguidas ao longo do axis, se todas sao verdadeiras
+    (a soma da janela e length). O resultado tem length - 1 posicoes a menos nesse axis."""
+    count = array.shape[axis] - length + 1
+    window = [slice(None)] * array.ndim
+    result = None
+    for offset in range(length):
+        window[axis] = slice(offset, offset + count)
+        result = array[tuple(window)] if result is None else result & array[tuple(window)]
+    return result
+
+
+class Geometry:
+    """Masks pre-calculadas de um tabuleiro size x size e de todos os placements dos comprimentos dados.
+    E partilhada por todos os tabuleiros com o mesmo tamanho e comprimentos (ver get_geometry)."""
+
+    def __init__(self, size: int, lengths: tuple):
+        self.size = size
+        self.lengths = lengths
+        cells = range(size * size)
+        self.all_cells = (1 << size * size) - 1
+        self.cell = [1 << idx for idx in cells]
+        self.row_masks = [self.coords_mask((row, col) for col in range(size)) for row in range(size)]
+        self.col_masks = [self.coords_mask((row, col) for row in range(size)) for col in range(size)]
+
+        self.up = [self.coords_mask([(idx // size - 1, idx % size)]) for idx in cells]
+        self.down = [self.coords_mask([(idx // size + 1, idx % size)]) for idx in cells]
+        self.left = [self.coords_mask([(idx // size, idx % size - 1)]) for idx in cells]
+        self.right = [self.coords_mask([(idx // size, idx % size + 1)]) for idx in cells]
+        self.diagonals = [self.coords_mask((idx // size + dr, idx % size + dc) for dr in (-1, 1) for dc in (-1, 1))
+                          for idx in cells]
+        self.neighbours = [self.up[idx] | self.down[idx] | self.left[idx] | self.right[idx] | self.diagonals[idx]
+                           for idx in cells]
+        # blocos 2x2 do tabuleiro: dois barcos tocam-se sse ocupam posicoes de um mesmo bloco
+        self.windows = [self.coords_mask([(row, col), (row + 1, col), (row, col + 1), (row + 1, col + 1)])
+                        for row in range(size - 1) for col in range(size - 1)]
+        # chaves de Zobrist: o hash de um tabuleiro e o xor das chaves (peca, celula) das posicoes preenchidas
+        rng = random.Random(size)
+        self.zobrist = {piece: [rng.getrandbits(64) for _ in cells] for piece in PIECES}
+
+        self.placements = self.build_placements()
+        self.all_placements = (1 << len(self.placements)) - 1
+        self.placement_ids = {placement.action: pid for pid, placement in enumerate(self.placements)}
+        # placements de cada comprimento
+        self.length_placements = dict.fromkeys(lengths, 0)
+        # placements que ocupam a celula / que tem a celula no seu halo
+        self.covering = [0] * (size * size)
+        self.touching = [0] * (size * size)
+        for pid, placement in enumerate(self.placements):
+            self.length_placements[placement.length] |= 1 << pid
+            for idx in iter_cells(placement.cells):
+                self.covering[idx] |= 1 << pid
+            for idx in iter_cells(placement.halo):
+                self.touching[idx] |= 1 << pid
+        # placements com alguma celula na row / col
+        self.row_placements = [self.cells_placements(mask) for mask in self.row_masks]
+        self.col_placements = [self.cells_placements(mask) for mask in self.col_masks]
+        # ids dos placements de cada comprimento indexados pela origem (ver Board.window_placements):
+        # (verticais, de forma (size - length + 1, size), horizontais, de forma (size, size - length + 1))
+        self.window_ids = {}
+        for length in lengths:
+            vertical = np.array([[self.placement_ids[("VERTICAL", (row, col), length)] for col in range(size)]
+                                 for row in range(size - length + 1)], dtype=np.intp).reshape(-1, size)
+            horizontal = None
+            if length > 1:
+                horizontal = np.array([[self.placement_ids[("HORIZONTAL", (row, col), length)]
+                                        for col in range(size - length + 1)] for row in range(size)], dtype=np.intp)
+            self.window_ids[length] = (vertical, horizontal)
+
+    def cells_placements(self, mask: int) -> int:
+        """Mask dos placements que ocupam alguma das celulas da mask."""
+        placements = 0
+        for idx in iter_cells(mask):
+            placements |= self.covering[idx]
+        return placements
+
+    def __deepcopy__(self, memo):
+        # imutavel: as copias dos tabuleiros partilham a mesma geometria
+        return self
+
+    def __reduce__(self):
+        # entre processos basta enviar o tamanho e os comprimentos; a geometria e recriada pela cache
+        return get_geometry, (self.size, self.lengths)
+
+    def index(self, row: int, col: int) -> int:
+        return row * self.size + col
+
+    def coords_mask(self, coords) -> int:
+        """Return the mask of the given coordinates, ignoring the ones out of bounds."""
+        mask = 0
+        for row, col in coords:
+            if 0 <= row < self.size and 0 <= col < self.size:
+                mask |= 1 << self.index(row, col)
+        return mask
+
+    def build_placements(self):
+        """Todas as posicoes possiveis de um barco, pela ordem em que Bimaru.actions as devolve."""
+        placements = []
+        for length in self.lengths:
+            for row in range(self.size):
+                for col in range(self.size):
+                    orientations = ("VERTICAL",) if length == 1 else ("VERTICAL", "HORIZONTAL")
+                    for orientation in orientations:
+                        if orientation == "VERTICAL":
+                            coords = [(row + offset, col) for offset in range(length)]
+                        else:
+                            coords = [(row, col + offset) for offset in range(length)]
+                        if coords[-1][0] >= self.size or coords[-1][1] >= self.size:
+                            continue
+                        cells = self.coords_mask(coords)
+                        halo = 0
+                        for idx in iter_cells(cells):
+                            halo |= self.neighbours[idx]
+                        rows = Counter(x for x, _ in coords)
+                        cols = Counter(y for _, y in coords)
+                        if length == 1:
+                            letters = "c"
+                        elif orientation == "VERTICAL":
+                            letters = "t" + "m" * (length - 2) + "b"
+                        else:
+                            letters = "l" + "m" * (length - 2) + "r"
+                        pieces = tuple((self.index(x, y), letter) for (x, y), letter in zip(coords, letters))
+                        placements.append(Placement((orientation, (row, col), length), length, cells, halo & ~cells,
+                                                    tuple(rows.items()), tuple(cols.items()), pieces))
+        return placements
+
+
+@functools.lru_cache(maxsize=None)
+def get_geometry(size: int = BOARD_SIZE, lengths: tuple = tuple(sorted(FLEET))) -> Geometry:
+    return Geometry(size, lengths)
+
+
+class Instance:
+    """Dados de uma instancia, que nao mudam durante a procura: hints, valores originais das rows e cols
+    e frota. E partilhada por todos os tabuleiros derivados da instancia."""
+
+    def __init__(self, total_hints: int, hints: list, row: list, col: list, fleet: dict = None):
+        self.total_hints = total_hints
+        self.hints = tuple(hints)
+        self.row_values = tuple(row)
+        self.col_values = tuple(col)
+        self.fleet = tuple(sorted((FLEET if fleet is None else fleet).items()))
+        self.size = len(row)
+        # peca da hint de cada posicao, e mask das posicoes com hints de cada peca
+        self.hint_at = dict(self.hints)
+        self.hint_masks = {}
+        for (row, col), piece in self.hints:
+            self.hint_masks[piece.lower()] = self.hint_masks.get(piece.lower(), 0) | 1 << row * self.size + col
+
+    def __deepcopy__(self, memo):
+        # imutavel: as copias dos tabuleiros partilham a mesma instancia
+        return self
+
 
-    def __init__(self, total_hints: int, hints: list, row: list, col: list):
-        self.matrix = np.zeros((10, 10), dtype=object)
+class Board:
+    """Representação interna de um tabuleiro de Bimaru.
+    Cada tipo de peca (e as posicoes livres) e guardado como uma bitmask."""
+
+    def __init__(self, instance: Instance):
+        """Tabuleiro vazio da instancia. So a parte que muda durante a procura (pecas, valores por
+        colocar das rows e cols, barcos por colocar, ...) e copiada com o tabuleiro."""
+        self.instance = instance
+        fleet = dict(instance.fleet)
+        size = instance.size
+        row, col = list(instance.row_values), list(instance.col_values)
+        self.geometry = get_geometry(size, tuple(sorted(fleet)))
+        self.pieces = dict.fromkeys(PIECES, 0)
+        self.free = self.geometry.all_cells
         self.row_values = row
         self.col_values = col
-        self.ships = {Battleship: 1, Cruiser: 2, Destroyer: 3, Submarine: 4}
-        self.hints = hints
-        self.num_hints_placed = total_hints
-        self.hints_placed = []
-        self.free_positions = 100
-        self.pieces_left = 20 # 1*4 + 2*3 + 3*2 + 4*1
+        self.ships = fleet
+        self.free_positions = size * size
+        self.pieces_left = sum(length * count for length, count in fleet.items())
+        self.live = self.geometry.all_placements
+        # contadores por linha: posicoes livres e linhas com menos posicoes livres que pecas
+        self.row_free = [size] * size
+        self.col_free = [size] * size
+        self.short_lines = sum(value > size for value in row + col)
+        # posicoes livres que se sabe terem de ser barco
+        self.required = 0
+        self.failed = False
+        # hash de Zobrist das pecas colocadas, atualizado em cada alteracao
+        self.zobrist = 0
+        self.trail = None
+
+    def __eq__(self, other):
+        if isinstance(other, Board):
+            return self.zobrist == other.zobrist and self.pieces == other.pieces
+        return NotImplemented
+
+    def __hash__(self):
+        return self.zobrist
+
+    def key(self) -> bytes:
+        """O tabuleiro no formato compacto (ver pack), que identifica o seu conteudo."""
+        return self.pack()
 
     def handle_hints(self):
-        for (x, y), piece in self.hints:
+        last = self.geometry.size - 1
+        for (x, y), piece in self.instance.hints:
             if piece == "C":
                 self.insert_circle(x, y)
-                self.num_hints_placed -= 1
-                self.hints_placed.append((x, y))
             elif piece == "W":
                 self.insert_water(x, y)
-                self.num_hints_placed -= 1
-                self.hints_placed.append((x, y))
             elif piece == "T":
-                if x == 8 or self.col_values[y] == 2:
+                if x == last - 1 or self.col_values[y] == 2:
                     self.insert_ship_vertical(x, y, 2)
                 else:
                     self.insert_top_waters(x, y)
@@ -87,7 +337,7 @@ class Board:
                 else:
                     self.insert_bottom_waters(x, y)
             elif piece == "L":
-                if y == 8 or self.row_values[x] == 2:
+                if y == last - 1 or self.row_values[x] == 2:
                     self.insert_ship_horizontal(x, y, 2)
                 else:
                     self.insert_left_waters(x, y)
@@ -99,50 +349,189 @@ class Board:
             elif piece == "M":
                 if x == 0 and self.row_values[x] == 3:
                     self.insert_ship_horizontal(x, y - 1, 3)
-                elif x == 9 and self.row_values[x] == 3:
+                elif x == last and self.row_values[x] == 3:
                     self.insert_ship_horizontal(x, y - 1, 3)
                 elif y == 0 and self.col_values[y] == 3:
                     self.insert_ship_vertical(x - 1, y, 3)
-                elif y == 9 and self.col_values[y] == 3:
+                elif y == last and self.col_values[y] == 3:
                     self.insert_ship_vertical(x - 1, y, 3)
                 else:
                     self.insert_middle_waters(x, y)
             self.fill_waters()
 
+        self.prune_hint_placements()
+
+    def prune_hint_placements(self):
+        """Uma hint so pode ser coberta por um barco que tenha essa peca nessa posicao"""
+        for (x, y), piece in self.instance.hints:
+            idx = self.geometry.index(x, y)
+            if piece in "TBLRM" and self.free & self.geometry.cell[idx]:
+                for pid in iter_cells(self.live & self.geometry.covering[idx]):
+                    if (idx, piece.lower()) not in self.geometry.placements[pid].pieces:
+                        self.live &= ~(1 << pid)
+
+    ############################################ PACKED ENCODING ######################################################
+    # Cada posicao ocupa 2 bits (0 livre, 1 agua, 2 barco, 3 livre mas tem de ser barco), pela ordem dos indices
+    # das posicoes: 25 bytes num tabuleiro 10x10, sempre o mesmo tamanho para o mesmo tamanho de tabuleiro.
+    # As letras das pecas de barco nao sao guardadas, porque sao determinadas pela forma dos barcos, e o resto do
+    # tabuleiro (valores por colocar, barcos por colocar, placements possiveis, ...) e reconstruido a partir da
+    # Instance. Serve de chave para caches, de mensagem entre processos e de registo em ficheiro.
+
+    def pack(self) -> bytes:
+        """O tabuleiro no formato compacto, com tamanho fixo para cada tamanho de tabuleiro."""
+        cells = self.geometry.size * self.geometry.size
+        nbytes = (cells + 7) // 8
+        ships = self.ship_cells | self.required & self.free
+        packed = spread_bits(self.pieces["w"] | self.required & self.free, nbytes) | spread_bits(ships, nbytes) << 1
+        return packed.to_bytes((2 * cells + 7) // 8, "little")
+
+    @staticmethod
+    def unpack(instance: Instance, data: bytes) -> "Board":
+        """O tabuleiro da instancia codificado em data por pack: coloca os barcos e a agua num tabuleiro
+        vazio e propaga, como depois de cada acao. A propagacao pode deduzir mais do que o tabuleiro
+        original, mas um tabuleiro completo e reconstruido exatamente."""
+        board = Board(instance)
+        geometry = board.geometry
+        nbytes = (geometry.size * geometry.size + 7) // 8
+        packed = int.from_bytes(data, "little")
+        even = int.from_bytes(b"\x55" * len(data), "little")
+        low = compact_bits(packed & even, nbytes)
+        high = compact_bits(packed >> 1 & even, nbytes)
+        water, ships, required = low & ~high, high & ~low, low & high
+
+        for idx in iter_cells(ships):
+            if ships & (geometry.up[idx] | geometry.left[idx]):
+                continue  # nao e a primeira posicao do barco
+            row, col = divmod(idx, geometry.size)
+            vertical = bool(ships & geometry.down[idx])
+            step = geometry.down if vertical else geometry.right
+            length, end = 1, idx
+            while ships & step[end]:
+                end = step[end].bit_length() - 1
+                length += 1
+            board.insert_ship("VERTICAL" if vertical else "HORIZONTAL", row, col, length)
+        board.insert_waters(water)
+        board.require(required)
+        board.prune_hint_placements()
+        board.fill_waters()
+        board.propagate()
+        return board
 
     def __str__(self):
+        hint_at = self.instance.hint_at
         result = ""
-        for row in range(10):
-            for col in range(10):
-                if self.matrix[row][col] == 0:
+        for row in range(self.geometry.size):
+            for col in range(self.geometry.size):
+                piece = self.get_value(row, col)
+                if piece == 0:
                     # should not happen at the end
                     result += "0"
                     continue
-                elif self.matrix[row][col] == "w":
-                    if ((row, col), "W") in self.hints:
-                        result += "W"
-                    else:
-                        result += "."
-                    continue
-                piece = self.matrix[row, col]
-                if ((row, col), piece.upper()) in self.hints:
-                    result += str(piece).upper()
+                hint = hint_at.get((row, col))
+                if piece == "w":
+                    result += "W" if hint == "W" else "."
+                elif hint == piece.upper():
+                    result += hint
                 else:
-                    result += str(piece)
+                    result += piece
             result += "\n"
         return result[:-1]
 
+    @property
+    def ship_cells(self) -> int:
+        """Mask das posicoes ocupadas por pecas de barco."""
+        return self.geometry.all_cells & ~(self.free | self.pieces["w"])
+
+    ############################################ TRAIL ################################################################
+
+    def record(self, container, key):
+        """Guarda no trail (se ativo) o valor atual de container[key], para ser reposto no undo"""
+        if self.trail is not None:
+            self.trail.append((container, key, container[key]))
+
+    def record_water(self):
+        attrs = self.__dict__
+        self.record(self.pieces, "w")
+        self.record(attrs, "free")
+        self.record(attrs, "free_positions")
+        self.record(attrs, "live")
+        self.record(attrs, "short_lines")
+        self.record(attrs, "zobrist")
+
+    def mark(self) -> int:
+        """Ativa o trail (caso ainda nao esteja) e devolve a sua posicao atual"""
+        if self.trail is None:
+            self.trail = []
+        return len(self.trail)
+
+    def undo(self, mark: int):
+        """Desfaz todas as escritas registadas no trail depois de mark"""
+        trail = self.trail
+        while len(trail) > mark:
+            container, key, value = trail.pop()
+            container[key] = value
+
     ############################################ INSERT PIECES #######################################################
 
     def insert_water(self, row: int, col: int):
         """Insere agua na respetiva posicao"""
-        if self.matrix[row,col] != "w":
-            self.matrix[row, col] = "w"
-            self.free_positions -= 1
+        self.insert_waters(self.geometry.coords_mask([(row, col)]))
+
+    def insert_waters(self, mask: int):
+        """Insere agua em todas as posicoes livres da mask"""
+        mask &= self.free
+        if mask:
+            self.record_water()
+            self.pieces["w"] |= mask
+            self.free &= ~mask
+            self.free_positions -= mask.bit_count()
+            live = self.live
+            zobrist = self.zobrist
+            covering = self.geometry.covering
+            keys = self.geometry.zobrist["w"]
+            for idx in iter_cells(mask):
+                live &= ~covering[idx]
+                zobrist ^= keys[idx]
+                self.count_line_cell(idx, -1)
+            self.live = live
+            self.zobrist = zobrist
+
+    def remove_water(self, row: int, col: int):
+        """Volta a libertar uma posicao com agua"""
+        geometry = self.geometry
+        idx = geometry.index(row, col)
+        self.record_water()
+        self.pieces["w"] &= ~geometry.cell[idx]
+        self.zobrist ^= geometry.zobrist["w"][idx]
+        self.free |= geometry.cell[idx]
+        self.free_positions += 1
+        self.count_line_cell(idx, 1)
+
+        # os placements que passam por esta posicao podem voltar a ser possiveis
+        ships = self.ship_cells
+        for pid in iter_cells(geometry.covering[idx]):
+            placement = geometry.placements[pid]
+            if placement.cells & self.free == placement.cells and not placement.halo & ships:
+                self.live |= 1 << pid
+
+    def count_line_cell(self, idx: int, delta: int):
+        """Atualiza os contadores de posicoes livres da row e col da celula idx,
+        quando esta deixa (delta = -1) ou volta (delta = 1) a estar livre"""
+        row, col = divmod(idx, self.geometry.size)
+        self.record(self.row_free, row)
+        self.record(self.col_free, col)
+        # a linha fica (ou deixa de ficar) com menos posicoes livres do que pecas por colocar
+        limit = 0 if delta < 0 else -1
+        if self.row_free[row] - self.row_values[row] == limit:
+            self.short_lines -= delta
+        if self.col_free[col] - self.col_values[col] == limit:
+            self.short_lines -= delta
+        self.row_free[row] += delta
+        self.col_free[col] += delta
 
     def fill_waters(self):
         """Preenche as rows e cols vazias com agua"""
-        for idx in range(10):
+        for idx in range(self.geometry.size):
             if self.row_values[idx] == 0:
                 self.fill_water_row(idx)
             if self.col_values[idx] == 0:
@@ -150,246 +539,114 @@ class Board:
 
     def fill_water_row(self, row: int):
         """Preenche uma row com agua"""
-        for col in range(10):
-            if self.is_free_position(row, col):
-                self.insert_water(row, col)
+        self.insert_waters(self.geometry.row_masks[row])
 
     def fill_water_col(self, col: int):
         """Preenche uma col com agua"""
-        for row in range(10):
-            if self.is_free_position(row, col):
-                self.insert_water(row, col)
-
-    def insert_top_waters(self, row: int, col: int):
-        adjacent_coords = self.get_all_adjacent_coords(row, col)
+        self.insert_waters(self.geometry.col_masks[col])
 
-        adjacent_coords.remove((row + 1, col))
-
-        for coord in adjacent_coords:
-            self.insert_water(coord[0], coord[1])
-
-        if self.is_free_position(row + 2, col - 1):
-            self.insert_water(row + 2, col - 1)
-
-        if self.is_free_position(row + 2, col + 1):
-            self.insert_water(row + 2, col + 1)
+    def insert_hint_waters(self, row: int, col: int, waters: int):
+        """Insere as aguas deduzidas de uma hint (que fica por colocar) na respetiva posicao"""
+        self.insert_waters(waters)
 
         if self.col_values[col] == 1:
             self.fill_water_col(col)
-            self.matrix[row, col] = 0
-            self.free_positions += 1
+            self.remove_water(row, col)
 
         if self.row_values[row] == 1:
             self.fill_water_row(row)
-            self.matrix[row, col] = 0
-            self.free_positions += 1
-
-    def insert_bottom_waters(self, row: int, col: int):
-        adjacent_coords = self.get_all_adjacent_coords(row, col)
-
-        adjacent_coords.remove((row - 1, col))
+            self.remove_water(row, col)
 
-        for coord in adjacent_coords:
-            self.insert_water(coord[0], coord[1])
-
-        if self.is_free_position(row - 2, col - 1):
-            self.insert_water(row - 2, col - 1)
-
-        if self.is_free_position(row - 2, col + 1):
-            self.insert_water(row - 2, col + 1)
-
-        if self.col_values[col] == 1:
-            self.fill_water_col(col)
-            self.matrix[row, col] = 0
-            self.free_positions += 1
+    def insert_top_waters(self, row: int, col: int):
+        geometry = self.geometry
+        idx = geometry.index(row, col)
+        waters = geometry.neighbours[idx] & ~geometry.down[idx] | geometry.coords_mask([(row + 2, col - 1), (row + 2, col + 1)])
+        self.insert_hint_waters(row, col, waters)
 
-        if self.row_values[row] == 1:
-            self.fill_water_row(row)
-            self.matrix[row, col] = 0
-            self.free_positions += 1
+    def insert_bottom_waters(self, row: int, col: int):
+        geometry = self.geometry
+        idx = geometry.index(row, col)
+        waters = geometry.neighbours[idx] & ~geometry.up[idx] | geometry.coords_mask([(row - 2, col - 1), (row - 2, col + 1)])
+        self.insert_hint_waters(row, col, waters)
 
     def insert_left_waters(self, row: int, col: int):
-        adjacent_coords = self.get_all_adjacent_coords(row, col)
-
-        adjacent_coords.remove((row, col + 1))
-
-        for coord in adjacent_coords:
-            self.insert_water(coord[0], coord[1])
-
-        if self.is_free_position(row - 1, col + 2):
-            self.insert_water(row - 1, col + 2)
-
-        if self.is_free_position(row + 1, col + 2):
-            self.insert_water(row + 1, col + 2)
-
-        if self.col_values[col] == 1:
-            self.fill_water_col(col)
-            self.matrix[row, col] = 0
-            self.free_positions += 1
-
-        if self.row_values[row] == 1:
-            self.fill_water_row(row)
-            self.matrix[row, col] = 0
-            self.free_positions += 1
+        geometry = self.geometry
+        idx = geometry.index(row, col)
+        waters = geometry.neighbours[idx] & ~geometry.right[idx] | geometry.coords_mask([(row - 1, col + 2), (row + 1, col + 2)])
+        self.insert_hint_waters(row, col, waters)
 
     def insert_right_waters(self, row: int, col: int):
-        adjacent_coords = self.get_all_adjacent_coords(row, col)
-
-        adjacent_coords.remove((row, col - 1))
-
-        for coord in adjacent_coords:
-            self.insert_water(coord[0], coord[1])
-
-        if self.is_free_position(row - 1, col - 2):
-            self.insert_water(row - 1, col - 2)
-
-        if self.is_free_position(row + 1, col - 2):
-            self.insert_water(row + 1, col - 2)
-
-        if self.col_values[col] == 1:
-            self.fill_water_col(col)
-            self.matrix[row, col] = 0
-            self.free_positions += 1
-
-        if self.row_values[row] == 1:
-            self.fill_water_row(row)
-            self.matrix[row, col] = 0
-            self.free_positions += 1
+        geometry = self.geometry
+        idx = geometry.index(row, col)
+        waters = geometry.neighbours[idx] & ~geometry.left[idx] | geometry.coords_mask([(row - 1, col - 2), (row + 1, col - 2)])
+        self.insert_hint_waters(row, col, waters)
 
     def insert_middle_waters(self, row: int, col: int):
-        diagonals = [
-            (row - 1, col - 1),
-            (row - 1, col + 1),
-            (row + 1, col - 1),
-            (row + 1, col + 1),
-        ]
-
-        for coord in diagonals:
-            if self.is_free_position(coord[0], coord[1]):
-                self.insert_water(coord[0], coord[1])
-
-        if self.col_values[col] == 1:
-            self.fill_water_col(col)
-            self.matrix[row, col] = 0
-            self.free_positions += 1
-
-        if self.row_values[row] == 1:
-            self.fill_water_row(row)
-            self.matrix[row, col] = 0
-            self.free_positions += 1
-
-    def insert_circle(self, row: int, col: int):
-        """Insere um circulo na respetiva posicao"""
-
-        self.matrix[row][col] = "c"
+        self.insert_hint_waters(row, col, self.geometry.diagonals[self.geometry.index(row, col)])
+
+    def insert_piece(self, row: int, col: int, piece: str, waters: int):
+        """Insere a peca na respetiva posicao e agua nas posicoes da mask waters"""
+        geometry = self.geometry
+        idx = geometry.index(row, col)
+        bit = geometry.cell[idx]
+        attrs = self.__dict__
+        self.record(self.pieces, piece)
+        self.record(attrs, "free")
+        self.record(self.row_values, row)
+        self.record(self.col_values, col)
+        self.record(attrs, "free_positions")
+        self.record(attrs, "pieces_left")
+        self.record(attrs, "live")
+        self.record(self.row_free, row)
+        self.record(self.col_free, col)
+        self.record(attrs, "zobrist")
+        self.pieces[piece] |= bit
+        self.zobrist ^= geometry.zobrist[piece][idx]
+        self.free &= ~bit
+        self.live &= ~(geometry.covering[idx] | geometry.touching[idx])
         self.row_values[row] -= 1
         self.col_values[col] -= 1
-        self.ships[Submarine] -= 1
         self.free_positions -= 1
         self.pieces_left -= 1
+        self.row_free[row] -= 1
+        self.col_free[col] -= 1
 
-        adjacent_positions = self.get_all_adjacent_coords(row, col)
-
-        for position in adjacent_positions:
-            self.insert_water(position[0], position[1])
+        self.insert_waters(waters)
 
         return True
 
+    def insert_circle(self, row: int, col: int):
+        """Insere um circulo na respetiva posicao"""
+        self.use_ship(Submarine)
+        return self.insert_piece(row, col, "c", self.geometry.neighbours[self.geometry.index(row, col)])
+
     def insert_top_piece(self, row: int, col: int):
         """Insere a peca superior na respetiva posicao"""
-
-        self.matrix[row][col] = "t"
-        self.row_values[row] -= 1
-        self.col_values[col] -= 1
-        self.free_positions -= 1
-        self.pieces_left -= 1
-
-        waters = self.get_all_adjacent_coords(row, col)
-        if (row + 1, col) in waters:
-            waters.remove((row + 1, col))
-
-        for water in waters:
-            self.insert_water(water[0], water[1])
-
-        return True
+        geometry = self.geometry
+        idx = geometry.index(row, col)
+        return self.insert_piece(row, col, "t", geometry.neighbours[idx] & ~geometry.down[idx])
 
     def insert_bottom_piece(self, row: int, col: int):
         """Insere a peca inferior na respetiva posicao"""
-
-        self.matrix[row][col] = "b"
-        self.row_values[row] -= 1
-        self.col_values[col] -= 1
-        self.free_positions -= 1
-        self.pieces_left -= 1
-
-        waters = self.get_all_adjacent_coords(row, col)
-        if (row - 1, col) in waters:
-            waters.remove((row - 1, col))
-
-        for water in waters:
-            self.insert_water(water[0], water[1])
-
-        return True
+        geometry = self.geometry
+        idx = geometry.index(row, col)
+        return self.insert_piece(row, col, "b", geometry.neighbours[idx] & ~geometry.up[idx])
 
     def insert_left_piece(self, row: int, col: int):
         """Insere a peca esquerda na respetiva posicao"""
-
-        self.matrix[row][col] = "l"
-        self.row_values[row] -= 1
-        self.col_values[col] -= 1
-        self.free_positions -= 1
-        self.pieces_left -= 1
-
-        waters = self.get_all_adjacent_coords(row, col)
-        if (row, col + 1) in waters:
-            waters.remove((row, col + 1))
-
-        for water in waters:
-            self.insert_water(water[0], water[1])
-
-        return True
+        geometry = self.geometry
+        idx = geometry.index(row, col)
+        return self.insert_piece(row, col, "l", geometry.neighbours[idx] & ~geometry.right[idx])
 
     def insert_right_piece(self, row: int, col: int):
         """Insere a peca direita na respetiva posicao"""
-
-        self.matrix[row][col] = "r"
-        self.row_values[row] -= 1
-        self.col_values[col] -= 1
-        self.free_positions -= 1
-        self.pieces_left -= 1
-
-        waters = self.get_all_adjacent_coords(row, col)
-        if (row, col - 1) in waters:
-            waters.remove((row, col - 1))
-
-        for water in waters:
-            self.insert_water(water[0], water[1])
-
-        return True
+        geometry = self.geometry
+        idx = geometry.index(row, col)
+        return self.insert_piece(row, col, "r", geometry.neighbours[idx] & ~geometry.left[idx])
 
     def insert_middle_piece(self, row: int, col: int):
         """Insere a peca do meio na respetiva posicao"""
-
-        self.matrix[row][col] = "m"
-        self.row_values[row] -= 1
-        self.col_values[col] -= 1
-        self.free_positions -= 1
-        self.pieces_left -= 1
-
-        waters = self.get_all_adjacent_coords(row, col)
-        if (row + 1, col) in waters:
-            waters.remove((row + 1, col))
-        if (row - 1, col) in waters:
-            waters.remove((row - 1, col))
-        if (row, col + 1) in waters:
-            waters.remove((row, col + 1))
-        if (row, col - 1) in waters:
-            waters.remove((row, col - 1))
-
-        for water in waters:
-            self.insert_water(water[0], water[1])
-
-        return True
+        return self.insert_piece(row, col, "m", self.geometry.diagonals[self.geometry.index(row, col)])
 
     def insert_value(self, row: int, col: int, value: str):
         """Insere o valor na respetiva posicao - retorna False caso nao seja possivel"""
@@ -412,45 +669,39 @@ class Board:
 
     ########################################### INSERT SHIPS ##########################################################
 
+    def insert_ship(self, orientation: str, row: int, col: int, length: int):
+        """Insert a ship of the given length at the given location and orientation."""
+        if orientation == "VERTICAL":
+            self.insert_ship_vertical(row, col, length)
+        elif orientation == "HORIZONTAL":
+            self.insert_ship_horizontal(row, col, length)
+
+    def use_ship(self, length: int):
+        """Retira um barco com o comprimento dado da frota por colocar"""
+        self.record(self.ships, length)
+        self.ships[length] -= 1
+
     def insert_ship_horizontal(self, row: int, col: int, length: int):
         """Insert a ship of the given length at the given location, horizontally."""
         if length == 1:
             self.insert_circle(row, col)
-        elif length == 2:
-            self.insert_left_piece(row, col)
-            self.insert_right_piece(row, col + 1)
-            self.ships[Destroyer] -= 1
-        elif length == 3:
-            self.insert_left_piece(row, col)
-            self.insert_middle_piece(row, col + 1)
-            self.insert_right_piece(row, col + 2)
-            self.ships[Cruiser] -= 1
-        elif length == 4:
-            self.insert_left_piece(row, col)
-            self.insert_middle_piece(row, col + 1)
-            self.insert_middle_piece(row, col + 2)
-            self.insert_right_piece(row, col + 3)
-            self.ships[Battleship] -= 1
+            return
+        self.insert_left_piece(row, col)
+        for offset in range(1, length - 1):
+            self.insert_middle_piece(row, col + offset)
+        self.insert_right_piece(row, col + length - 1)
+        self.use_ship(length)
 
     def insert_ship_vertical(self, row: int, col: int, length: int):
         """Insert a ship of the given length at the given location, vertically."""
         if length == 1:
             self.insert_circle(row, col)
-        elif length == 2:
-            self.insert_top_piece(row, col)
-            self.insert_bottom_piece(row + 1, col)
-            self.ships[Destroyer] -= 1
-        elif length == 3:
-            self.insert_top_piece(row, col)
-            self.insert_middle_piece(row + 1, col)
-            self.insert_bottom_piece(row + 2, col)
-            self.ships[Cruiser] -= 1
-        elif length == 4:
-            self.insert_top_piece(row, col)
-            self.insert_middle_piece(row + 1, col)
-            self.insert_middle_piece(row + 2, col)
-            self.insert_bottom_piece(row + 3, col)
-            self.ships[Battleship] -= 1
+            return
+        self.insert_top_piece(row, col)
+        for offset in range(1, length - 1):
+            self.insert_middle_piece(row + offset, col)
+        self.insert_bottom_piece(row + length - 1, col)
+        self.use_ship(length)
 
 
     ########################### CHECKS WHAT SHIP LENGTH CAN BE PLACED #################################################
@@ -458,11 +709,11 @@ class Board:
         """Return the maximum possible length of a ship that can be placed at the given location, horizontally."""
         max_length = 0
         limit = max(size for size, count in self.ships.items() if count > 0)
+        ships = self.ship_cells
         for offset in range(limit):
             if not self.is_free_position(row, col + offset) or self.col_values[col + offset] < 1:
                 break
-            if any(value != 'OUT' and value != 0 and value != "w"
-                   for value in self.get_all_adjacent_values(row, col + offset)):  # if there's a ship nearby
+            if self.geometry.neighbours[self.geometry.index(row, col + offset)] & ships:  # if there's a ship nearby
                 break
             max_length += 1
         return min(max_length, self.row_values[row])
@@ -471,61 +722,55 @@ class Board:
         """Return the maximum possible length of a ship that can be placed at the given location, vertically."""
         max_length = 0
         limit = max(size for size, count in self.ships.items() if count > 0)
-        for offset in range(4):
+        ships = self.ship_cells
+        for offset in range(limit):
             if not self.is_free_position(row + offset, col) or self.row_values[row + offset] < 1:
                 break
-
-            if any(value != 'OUT' and value != 0 and value != "w"
-                   for value in self.get_all_adjacent_values(row + offset, col)):  # if there's a ship nearby
+            if self.geometry.neighbours[self.geometry.index(row + offset, col)] & ships:  # if there's a ship nearby
                 break
             max_length += 1
         return min(max_length, self.col_values[col])
 
 
-    def can_place_vertical_ship(self, row: int, col: int, length: int) -> bool:
-
-        if length > self.col_values[col]:
+    def can_place_ship(self, action) -> bool:
+        """Verifica se o barco descrito pela action pode ser colocado no tabuleiro"""
+        pid = self.geometry.placement_ids.get(action)
+        if pid is None:  # sai do tabuleiro
             return False
-
-        for offset in range(length):
-
-            if not self.is_free_position(row + offset, col) or self.row_values[row + offset] < 1:
-                return False
-
-            if any(value != 0 and value != "w" for value in self.get_all_adjacent_values(row + offset, col)):
-                return False
-
-        return True
-
-    def can_place_horizontal_ship(self, row: int, col: int, length: int) -> bool:
-
-        if length > self.row_values[row]:
+        placement = self.geometry.placements[pid]
+        if not self.live >> pid & 1:
             return False
+        return self.placement_fits(placement)
 
-        for offset in range(length):
-
-            if not self.is_free_position(row, col + offset) or self.col_values[col + offset] < 1:
-                return False
+    def can_place_vertical_ship(self, row: int, col: int, length: int) -> bool:
+        return self.can_place_ship(("VERTICAL", (row, col), length))
 
-            if any(value != 0 and value != "w" for value in self.get_all_adjacent_values(row, col + offset)):
-                return False
-        return True
+    def can_place_horizontal_ship(self, row: int, col: int, length: int) -> bool:
+        return self.can_place_ship(("HORIZONTAL", (row, col), length))
 
     ########################################### GET VALUES ###########################################################
 
     def is_free_position(self, row: int, col: int) -> bool:
         """Verifica se a posicao esta livre"""
-        return self.get_value(row, col) == 0
+        if row < 0 or col < 0 or row >= self.geometry.size or col >= self.geometry.size:
+            return False
+        return bool(self.free & self.geometry.cell[self.geometry.index(row, col)])
 
     def get_value(self, row: int, col: int):
         """
         Devolve o valor na respetiva posição do tabuleiro.
-        Returns -1, None or a string value.
+        Returns -1, 0 or a string value.
         """
-        if row < 0 or col < 0 or row >= 10 or col >= 10:
+        if row < 0 or col < 0 or row >= self.geometry.size or col >= self.geometry.size:
             return -1  # OUT OF BOUNDS
 
-        return self.matrix[row, col]
+        bit = self.geometry.cell[self.geometry.index(row, col)]
+        if self.free & bit:
+            return 0
+        for piece, mask in self.pieces.items():
+            if mask & bit:
+                return piece
+        return 0
 
     def adjacent_vertical_values(self, row: int, col: int) -> (str, str):
         """Devolve os valores imediatamente acima e abaixo,
@@ -552,15 +797,7 @@ class Board:
 
     def get_all_adjacent_values(self, row: int, col: int) -> list:
         """Return all adjacent values."""
-        # Get vertical, horizontal, and diagonal adjacent values
-
-        # Combine all adjacent values into a single list
-        adjacent_values = self.get_all_adjacent_coords(row, col)
-
-        # Filter out any 'OUT OF BOUNDS' values
-        adjacent_values = [self.matrix[x, y] for (x, y) in adjacent_values]
-
-        return adjacent_values
+        return [self.get_value(x, y) for (x, y) in self.get_all_adjacent_coords(row, col)]
 
     def get_all_adjacent_coords(self, row: int, col: int) -> list:
         """Return all adjacent coordinates."""
@@ -587,27 +824,207 @@ class Board:
     def parse_instance():
         """Lê o test do standard input (stdin) que é passado como argumento
         e retorna uma instância da classe Board. """
+        return Board.parse_lines(sys.stdin)
+
+    @staticmethod
+    def parse_lines(lines):
+        """Cria o Board descrito pelas linhas de uma instancia.
+        O tamanho do tabuleiro e dado pela linha ROW. Uma linha opcional "FLEET n1 n2 ..." indica
+        quantos barcos ha de comprimento 1, 2, ...; sem ela e usada a frota do enunciado."""
 
         HINTS = []
         ROW = []
         COLUMN = []
+        FLEET_COUNTS = None
         total_hints = 0
-        for line in sys.stdin:
-            if "ROW" in line:
-                ROW = [int(x) for x in line.split()[1:]]
-            elif "COLUMN" in line:
-                COLUMN = [int(x) for x in line.split()[1:]]
-            elif "HINT" in line:
-                line = line.split()
-                HINTS.append(((int(line[1]), int(line[2])), line[3]))
+        for line in lines:
+            fields = line.split()
+            if not fields:
+                continue
+            keyword = fields[0]
+            if keyword == "ROW":
+                ROW = [int(x) for x in fields[1:]]
+            elif keyword == "COLUMN":
+                COLUMN = [int(x) for x in fields[1:]]
+            elif keyword == "HINT":
+                HINTS.append(((int(fields[1]), int(fields[2])), fields[3]))
+            elif keyword == "FLEET":
+                FLEET_COUNTS = {length: int(x) for length, x in enumerate(fields[1:], 1) if int(x) > 0}
             else:
-                total_hints = int(line[0])
+                total_hints = int(keyword)
 
-        board = Board(total_hints, HINTS, ROW, COLUMN)
+        board = Board(Instance(total_hints, HINTS, ROW, COLUMN, FLEET_COUNTS))
         board.handle_hints()
         board.fill_waters()
+        board.propagate()
         return board
 
+    @staticmethod
+    def stream_instances(stream=None, chunk_size: int = 1 << 16):
+        """Gera um Board por cada instancia de uma stream de bytes (por omissao sys.stdin.buffer).
+        As instancias sao separadas por uma linha INSTANCE_DELIMITER; a ultima pode acabar no EOF.
+        A stream e lida aos blocos e cada Board e gerado logo que a sua instancia acaba, por isso
+        a memoria usada nao depende do numero de instancias."""
+        if stream is None:
+            stream = sys.stdin.buffer
+        # read1 devolve o que ja chegou, sem esperar que o bloco fique cheio
+        read = getattr(stream, "read1", stream.read)
+        pending = b""
+        lines = []
+        while True:
+            chunk = read(chunk_size)
+            if not chunk:
+                break
+            chunk = pending + chunk
+            end = chunk.rfind(b"\n") + 1
+            pending = chunk[end:]
+            for line in chunk[:end].decode().splitlines():
+                if line.strip() == INSTANCE_DELIMITER:
+                    if lines:
+                        yield Board.parse_lines(lines)
+                    lines = []
+                else:
+                    lines.append(line)
+        if pending:
+            lines.append(pending.decode())
+        if any(line.strip() for line in lines):
+            yield Board.parse_lines(lines)
+
+    ########################################### PROPAGATION ###########################################################
+
+    def placement_fits(self, placement: Placement) -> bool:
+        """Verifica se o placement cabe nos valores por colocar das rows e cols"""
+        row_values = self.row_values
+        col_values = self.col_values
+        return all(row_values[row] >= count for row, count in placement.rows) and \
+            all(col_values[col] >= count for col, count in placement.cols)
+
+    def fitting_placements(self, lengths) -> int:
+        """Mask dos placements ainda possiveis, com os comprimentos dados, que cabem nas rows e cols"""
+        candidates = 0
+        for length in lengths:
+            candidates |= self.geometry.length_placements[length]
+        fitting = 0
+        for pid in iter_cells(self.live & candidates):
+            if self.placement_fits(self.geometry.placements[pid]):
+                fitting |= 1 << pid
+        return fitting
+
+    def window_placements(self, length: int) -> list:
+        """Ids, por ordem crescente, dos placements ainda possiveis do comprimento dado que cabem nas rows
+        e cols: o mesmo que fitting_placements([length]), calculado para todas as origens de uma vez com
+        janelas deslizantes de comprimento length sobre os valores por colocar das rows e cols. Os
+        placements que ja nao cabem nas posicoes do tabuleiro estao fora de live."""
+        rows = np.array(self.row_values)
+        cols = np.array(self.col_values)
+        nbytes = (len(self.geometry.placements) + 7) // 8
+        live = np.unpackbits(np.frombuffer(self.live.to_bytes(nbytes, "little"), np.uint8), bitorder="little")
+        live = live.astype(bool)
+
+        vertical_ids, horizontal_ids = self.geometry.window_ids[length]
+        # vertical: length rows com pecas por colocar e a col com pelo menos length
+        fits = window_all(rows > 0, length, 0)[:, None] & (cols >= length)
+        pids = vertical_ids[fits & live[vertical_ids]]
+        if horizontal_ids is not None:
+            fits = window_all(cols > 0, length, 0) & (rows >= length)[:, None]
+            pids = np.concatenate((pids, horizontal_ids[fits & live[horizontal_ids]]))
+        pids.sort()
+        return pids.tolist()
+
+    def fail(self) -> bool:
+        self.record(self.__dict__, "failed")
+        self.failed = True
+        return False
+
+    def require(self, mask: int):
+        """Marca as posicoes livres da mask como tendo de ser barco"""
+        mask &= self.free & ~self.required
+        if not mask:
+            return
+        attrs = self.__dict__
+        self.record(attrs, "required")
+        self.record(attrs, "live")
+        self.required |= mask
+        waters = 0
+        for idx in iter_cells(mask):
+            # nenhum barco pode tocar nesta posicao sem a ocupar, e as diagonais sao agua
+            self.live &= ~self.geometry.touching[idx]
+            waters |= self.geometry.diagonals[idx]
+        self.insert_waters(waters)
+
+    def require_hints(self):
+        """Marca as hints por colocar, e as pecas vizinhas que estas obrigam, como barco"""
+        for (row, col), piece in self.instance.hints:
+            idx = self.geometry.index(row, col)
+            if piece not in "TBLRM" or not self.free & self.geometry.cell[idx]:
+                continue
+            if piece == "T":
+                self.require(self.geometry.cell[idx] | self.geometry.down[idx])
+            elif piece == "B":
+                self.require(self.geometry.cell[idx] | self.geometry.up[idx])
+            elif piece == "L":
+                self.require(self.geometry.cell[idx] | self.geometry.right[idx])
+            elif piece == "R":
+                self.require(self.geometry.cell[idx] | self.geometry.left[idx])
+            else:
+                self.require(self.geometry.cell[idx])
+                # fora do tabuleiro ou agua num dos lados obriga o barco a seguir pelo outro eixo
+                if not self.geometry.up[idx] or not self.geometry.down[idx] or (self.geometry.up[idx] | self.geometry.down[idx]) & self.pieces["w"]:
+                    self.require(self.geometry.left[idx] | self.geometry.right[idx])
+                elif not self.geometry.left[idx] or not self.geometry.right[idx] or (self.geometry.left[idx] | self.geometry.right[idx]) & self.pieces["w"]:
+                    self.require(self.geometry.up[idx] | self.geometry.down[idx])
+
+    def propagate_lines(self) -> bool:
+        """Linhas saturadas ficam com agua; linhas com tantas posicoes livres como pecas ficam barco"""
+        for masks, values, free_counts in ((self.geometry.row_masks, self.row_values, self.row_free),
+                                           (self.geometry.col_masks, self.col_values, self.col_free)):
+            for line in range(self.geometry.size):
+                required = (self.required & masks[line]).bit_count()
+                if required > values[line]:
+                    return False
+                if required == values[line]:
+                    self.insert_waters(masks[line] & ~self.required)
+                elif free_counts[line] == values[line]:
+                    self.require(masks[line])
+        return True
+
+    def propagate(self) -> bool:
+        """Aplica as regras do Bimaru ate nao haver alteracoes.
+        Devolve False (e marca o tabuleiro como failed) caso se chegue a uma contradicao."""
+        while True:
+            if self.failed or self.short_lines or self.required & self.pieces["w"]:
+                return self.fail()
+            if self.required & ~self.free:
+                self.record(self.__dict__, "required")
+                self.required &= self.free
+
+            before = (self.free, self.required)
+            self.require_hints()
+            if not self.propagate_lines():
+                return self.fail()
+            if self.short_lines or self.required & self.pieces["w"]:
+                return self.fail()
+
+            # posicoes que nenhum barco por colocar consegue cobrir sao agua
+            fitting = self.fitting_placements(length for length, count in self.ships.items() if count > 0)
+            coverable = 0
+            for pid in iter_cells(fitting):
+                coverable |= self.geometry.placements[pid].cells
+            if self.required & ~coverable:
+                return self.fail()
+            self.insert_waters(~coverable)
+
+            # uma posicao obrigatoria coberta por um unico placement obriga a esse barco
+            for idx in iter_cells(self.required):
+                covering = fitting & self.geometry.covering[idx]
+                if covering & (covering - 1) == 0:
+                    orientation, (row, col), length = self.geometry.placements[covering.bit_length() - 1].action
+                    self.insert_ship(orientation, row, col, length)
+                    break
+
+            if (self.free, self.required) == before:
+                return True
+
     ########################################### CHECK BOARD VALIDITY ##################################################
 
     def is_complete(self):
@@ -617,20 +1034,18 @@ class Board:
         return True
 
     def all_hints_placed(self):
-        for (row, col), piece in self.hints:
-            if (self.matrix[row, col]).upper() != piece:
+        """Cada hint tem a sua peca no tabuleiro."""
+        for piece, mask in self.instance.hint_masks.items():
+            if self.pieces[piece] & mask != mask:
                 return False
-            if (row, col) not in self.hints_placed and self.matrix[row, col] == piece:
-                self.num_hints_placed -= 1
-                self.hints_placed.append((row, col))
         return True
 
     def find_largest_vertical_ship(self, row: int, col: int) -> int:
         """Return the size of the largest vertical ship that contains the given cell."""
         size = 1
-        while row + size < 10 and self.matrix[row + size, col] == "m":
+        while row + size < self.geometry.size and self.get_value(row + size, col) == "m":
             size += 1
-        if self.matrix[row + size, col] == "b":
+        if self.get_value(row + size, col) == "b":
             size += 1
         else:
             return -1
@@ -640,9 +1055,9 @@ class Board:
     def find_largest_horizontal_ship(self, row: int, col: int) -> int:
         """Return the size of the largest horizontal ship that contains the given cell."""
         size = 1
-        while col + size < 10 and self.matrix[row, col + size] == "m":
+        while col + size < self.geometry.size and self.get_value(row, col + size) == "m":
             size += 1
-        if self.matrix[row, col + size] == "r":
+        if self.get_value(row, col + size) == "r":
             size += 1
         else:
             return -1
@@ -653,10 +1068,25 @@ class Board:
 
 class Bimaru(Problem):
 
-    def __init__(self, initial: BimaruState):
-        """O construtor especifica o estado inicial."""
+    def __init__(self, initial: BimaruState, order: str = "board", seed: int = 0, canonical: bool = False,
+                 heuristic=("ships", "hints", "lines"), branching: str = "largest", vectorized: bool = False):
+        """O construtor especifica o estado inicial.
+        order escolhe a ordem das ações (ver ORDERINGS); seed e usada pela ordem "shuffled".
+        Com canonical, os barcos do mesmo comprimento sao colocados por ordem crescente de placement,
+        por isso cada conjunto de barcos e colocado numa unica ordem.
+        heuristic sao os nomes dos estimadores de heuristics.ESTIMATORS usados por self.h.
+        branching escolhe em que placements se ramifica (ver BRANCHINGS); canonical so se aplica a "largest".
+        Com vectorized, os placements de "largest" sao calculados com NumPy (ver Board.window_placements)."""
         super().__init__(initial)
         self.board = initial.board
+        self.order = order
+        self.canonical = canonical
+        self.heuristic = Heuristic(heuristic)
+        self.branching = branching
+        self.vectorized = vectorized
+        self.refute_board = None
+        self.refute_path = []
+        self.random = random.Random(seed)
         # self.goal = ...
 
     def actions(self, state: BimaruState):
@@ -677,40 +1107,61 @@ class Bimaru(Problem):
                 all(row_val < max_ship_length for row_val in state.board.row_values):
             return actions
 
-        # Loop over each cell in the board
-        for row in range(10):
-            # free positions dessa row < row_value
-            if sum(state.board.is_free_position(row, y) for y in range(10)) < state.board.row_values[row]:
-                return []
-
-            if state.board.row_values[row] == 0:
-                continue
+        board = state.board
 
-            for col in range(10):
-
-                # free positions dessa col < col_value
-                if row == 0 and sum(state.board.is_free_position(x, col) for x in range(10)) < state.board.col_values[col]:
-                    return []
-
-                if state.board.col_values[col] == 0:
-                    continue
+        # free positions de alguma row/col < row/col_value, ou contradicao encontrada na propagacao
+        if board.short_lines or board.failed:
+            return []
 
-                # Check if the current cell is empty
-                if state.board.is_free_position(row, col):  # checks if value == 0
+        if self.branching == "constrained":
+            return self.order_actions(self.constrained_actions(board))
 
+        if self.vectorized:
+            pids = board.window_placements(max_ship_length)
+            if self.canonical and state.last is not None and \
+                    board.geometry.placements[state.last].length == max_ship_length:
+                pids = [pid for pid in pids if pid > state.last]
+            return self.order_actions([board.geometry.placements[pid].action for pid in pids])
 
-                    if max_ship_length == 1:
-                        adjacents = state.board.get_all_adjacent_values(row, col)
-                        if all(x == 0 or x == "w" for x in adjacents):
-                            actions.append(("VERTICAL", (row, col), max_ship_length))
+        # Filtra os placements ainda possiveis do maior barco por colocar
+        candidates = board.fitting_placements([max_ship_length])
+        if self.canonical and state.last is not None and \
+                board.geometry.placements[state.last].length == max_ship_length:
+            # so os placements depois do ultimo barco deste comprimento
+            candidates &= ~((2 << state.last) - 1)
+        for pid in iter_cells(candidates):
+            actions.append(board.geometry.placements[pid].action)
+        return self.order_actions(actions)
 
-                    else:
-
-                        if state.board.can_place_vertical_ship(row, col, max_ship_length):
-                            actions.append(("VERTICAL", (row, col), max_ship_length))
-
-                        if state.board.can_place_horizontal_ship(row, col, max_ship_length):
-                            actions.append(("HORIZONTAL", (row, col), max_ship_length))
+    @staticmethod
+    def constrained_actions(board: Board) -> list:
+        """Ramifica na decisao mais restrita: a posicao que tem de ser barco (hints incluidas), a
+        row/col com pecas por colocar ou o maior barco por colocar com menos placements possiveis.
+        Num tabuleiro solucao algum desses placements esta presente, por isso basta tenta-los."""
+        geometry = board.geometry
+        lengths = [length for length, count in board.ships.items() if count > 0]
+        fitting = board.fitting_placements(lengths)
+        best = None
+        best_count = None
+        decisions = [geometry.length_placements[max(lengths)]]
+        decisions += [geometry.covering[idx] for idx in iter_cells(board.required)]
+        decisions += [geometry.row_placements[row] for row, value in enumerate(board.row_values) if value > 0]
+        decisions += [geometry.col_placements[col] for col, value in enumerate(board.col_values) if value > 0]
+        for decision in decisions:
+            options = fitting & decision
+            count = options.bit_count()
+            if best is None or count < best_count:
+                best, best_count = options, count
+                if count <= 1:
+                    break
+        return [geometry.placements[pid].action for pid in iter_cells(best)]
+
+    def order_actions(self, actions: list) -> list:
+        """Ordena as ações segundo self.order."""
+        if self.order == "reversed":
+            actions.reverse()
+        elif self.order == "shuffled":
+            self.random.shuffle(actions)
         return actions
 
     def result(self, state: BimaruState, action):
@@ -719,20 +1170,86 @@ class Bimaru(Problem):
         das presentes na lista obtida pela execução de
         self.actions(state)."""
 
+        new_board = copy.deepcopy(state.board)
+        self.insert_action(new_board, action)
+        new_state = BimaruState(new_board, new_board.geometry.placement_ids[action] if self.canonical else None)
+        return new_state
+
+    def apply(self, state: BimaruState, action):
+        """Executa a 'action' diretamente sobre o tabuleiro de 'state'.
+        Devolve o token que permite desfaze-la com self.undo."""
+        token = (state.board.mark(), state.last)
+        self.insert_action(state.board, action)
+        if self.canonical:
+            state.last = state.board.geometry.placement_ids[action]
+        return token
+
+    def undo(self, state: BimaruState, token):
+        """Desfaz a ação executada por self.apply que devolveu 'token'."""
+        mark, state.last = token
+        state.board.undo(mark)
+
+    @staticmethod
+    def insert_action(board: Board, action):
+        """Coloca no tabuleiro o barco descrito pela 'action' e propaga as suas consequencias."""
         orientation = action[0]
         row, col = action[1]
         length = action[2]
 
-        new_board = copy.deepcopy(state.board)
-
-        if orientation == "VERTICAL":
-            new_board.insert_ship_vertical(row, col, length)
-        elif orientation == "HORIZONTAL":
-            new_board.insert_ship_horizontal(row, col, length)
+        board.insert_ship(orientation, row, col, length)
+        board.fill_waters()
+        board.propagate()
+
+    def replay(self, actions):
+        """Aplica os placements das actions ao tabuleiro inicial e devolve o tabuleiro, ou None se
+        algum placement ja nao cabe. Usa uma copia propria do tabuleiro inicial, onde ficam aplicadas
+        as actions da ultima chamada: so e desfeito (com o trail) o que nao e prefixo comum com as
+        actions pedidas."""
+        if self.refute_board is None:
+            self.refute_board = copy.deepcopy(self.board)
+            self.refute_board.mark()
+        board = self.refute_board
+        applied = self.refute_path  # (action, mark do trail antes de a aplicar)
+        common = 0
+        while common < min(len(applied), len(actions)) and applied[common][0] == actions[common]:
+            common += 1
+        if common < len(applied):
+            board.undo(applied[common][1])
+            del applied[common:]
+        for action in actions[common:]:
+            mark = board.mark()
+            placement = board.geometry.placements[board.geometry.placement_ids[action]]
+            if not all(board.pieces[letter] >> idx & 1 for idx, letter in placement.pieces):  # senao ja colocado
+                if not board.can_place_ship(action):
+                    return None
+                self.insert_action(board, action)
+            applied.append((action, mark))
+        return board
 
-        new_board.fill_waters()
-        new_state = BimaruState(new_board)
-        return new_state
+    def refutes(self, actions) -> bool:
+        """Verifica se as actions levam a um tabuleiro sem solucao (um placement que ja nao cabe, ou
+        um estado sem ações que nao e objetivo)."""
+        board = self.replay(actions)
+        if board is None:
+            return True
+        mark = board.mark()
+        state = BimaruState(board)
+        refuted = not self.actions(state) and not self.goal_test(state)
+        board.undo(mark)
+        return refuted
+
+    def covers(self, actions, tried) -> bool:
+        """Verifica se, depois das actions, todas as ações possiveis estao em tried (ou o tabuleiro
+        nao tem solucao). Como qualquer solucao que continua um estado usa uma das suas ações (em
+        todas as ramificacoes), qualquer solucao com estes placements usa uma ação de tried."""
+        board = self.replay(actions)
+        if board is None:
+            return True
+        mark = board.mark()
+        state = BimaruState(board)
+        covered = not self.goal_test(state) and set(self.actions(state)) <= tried
+        board.undo(mark)
+        return covered
 
     def goal_test(self, state: BimaruState):
         """Retorna True se e só se o estado passado como argumento é
@@ -748,34 +1265,476 @@ class Bimaru(Problem):
         return state.board.is_complete() and state.board.all_hints_placed()
 
     def h(self, node: Node):
-        """Função heuristica utilizada para a procura A*."""
-        # Primeira heuristica: numero de barcos por colocar
-        # Prioritiza os estados com menos barcos para colocar
-        state = node.state
-
-        remaining_pieces = state.board.pieces_left + state.board.free_positions + sum(state.board.row_values) + sum(state.board.col_values) + (state.board.num_hints_placed * 10)
-        return remaining_pieces
+        """Função heuristica utilizada para a procura A*: os estimadores escolhidos (ver heuristics.py)."""
+        return self.heuristic(node)
 
 
 
 """ __NOVA FUNÇOES__ """
 
+SEARCHES = {
+    "tree": depth_first_tree_search,
+    "trail": depth_first_backtracking_search,
+    "bfs": breadth_first_tree_search,
+    "ids": iterative_deepening_search,
+    "ucs": uniform_cost_search,
+    "greedy": greedy_search,
+    "astar": astar_search,
+    "rbfs": recursive_best_first_search,
+    "parallel": parallel_depth_first_search,
+    "cbj": conflict_directed_search,
+}
+
+# ordens das ações de Bimaru.actions: a do tabuleiro, a inversa, ou aleatoria (com seed fixa)
+ORDERINGS = ("board", "reversed", "shuffled")
+
+# procuras que aceitam node_class, e por isso podem descartar o parent dos nos (ver LeanNode)
+PARENTLESS_SEARCHES = ("tree", "bfs", "ucs", "greedy", "astar", "rbfs")
+
+# politicas de ramificacao de Bimaru.actions: todos os placements do maior barco por colocar,
+# ou apenas os que resolvem a decisao mais restrita (ver Bimaru.constrained_actions)
+BRANCHINGS = ("largest", "constrained")
+
+
+def search_solve(board: Board, search: str = "tree", telemetry: str = None, parentless: bool = False, **options):
+    """Resolve o tabuleiro com o problema Bimaru e a procura dada. Devolve o tabuleiro resolvido ou None.
+    options sao passadas ao construtor de Bimaru (order, canonical, heuristic, ...).
+    Com telemetry, as estatisticas da procura (ver TelemetryProblem) sao escritas nesse ficheiro,
+    em CSV se o nome acabar em .csv e em JSON caso contrario.
+    Com parentless, as procuras de PARENTLESS_SEARCHES usam LeanNode: so o tabuleiro final interessa,
+    por isso os nos nao guardam o caminho e a fronteira ocupa menos memoria."""
+    problem = Bimaru(BimaruState(board), **options)
+    if telemetry is not None:
+        problem = TelemetryProblem(problem)
+    if parentless and search in PARENTLESS_SEARCHES:
+        solution_node = SEARCHES[search](problem, node_class=LeanNode)
+    else:
+        solution_node = SEARCHES[search](problem)
+    if telemetry is not None:
+        problem.stop()
+        with open(telemetry, "w", newline="") as file:
+            if telemetry.endswith(".csv"):
+                problem.write_csv(file)
+            else:
+                problem.write_json(file)
+    if solution_node is None:
+        return None
+    return solution_node.state.board
+
+
+def search_solutions(board: Board):
+    """Gera, um a um, os tabuleiros solucao distintos. Usa a ramificacao canonica, para nao repetir
+    o mesmo conjunto de barcos por outra ordem, e nao volta a procurar sub-tabuleiros ja sem solucao."""
+    problem = Bimaru(BimaruState(board), canonical=True)
+    found = set()
+    for node in depth_first_tree_solutions(problem, BimaruState.key):
+        solution = node.state.board
+        if solution not in found:
+            found.add(solution)
+            yield solution
+
+
+def unique_solution(board: Board):
+    """Devolve (numero de solucoes, ate 2; primeira solucao ou None). Para na segunda solucao."""
+    solutions = list(itertools.islice(search_solutions(board), 2))
+    return len(solutions), solutions[0] if solutions else None
+
+
+def exact_cover_problem(board: Board) -> ExactCover:
+    """Formula o resto do tabuleiro como exact cover: cada placement possivel e uma opcao que
+    cobre o seu comprimento, as rows e cols (com o numero de pecas que la coloca), as posicoes
+    obrigatorias e, como items secundarios, os blocos 2x2 em que toca."""
+    lengths = [length for length, count in board.ships.items() if count > 0]
+    demands = {("ship", length): board.ships[length] for length in lengths}
+    demands.update((("row", row), value) for row, value in enumerate(board.row_values))
+    demands.update((("col", col), value) for col, value in enumerate(board.col_values))
+    demands.update((("cell", idx), 1) for idx in iter_cells(board.required))
+
+    options = {}
+    for pid in iter_cells(board.fitting_placements(lengths)):
+        placement = board.geometry.placements[pid]
+        items = {("ship", placement.length): 1}
+        items.update((("row", row), count) for row, count in placement.rows)
+        items.update((("col", col), count) for col, count in placement.cols)
+        items.update((("cell", idx), 1) for idx in iter_cells(placement.cells & board.required))
+        items.update((("window", window), 1) for window, mask in enumerate(board.geometry.windows) if mask & placement.cells)
+        options[pid] = items
+    return ExactCover(options, demands)
+
+
+def exact_cover_solve(board: Board):
+    """Resolve o tabuleiro com o exact cover. Devolve o tabuleiro resolvido ou None."""
+    if board.failed:
+        return None
+    solution = exact_cover_problem(board).solve()
+    if solution is None:
+        return None
+    board = copy.deepcopy(board)
+    for pid in solution:
+        orientation, (row, col), length = board.geometry.placements[pid].action
+        board.insert_ship(orientation, row, col, length)
+    board.insert_waters(board.free)
+    return board
+
+
+def sat_problem(board: Board):
+    """Codifica o resto do tabuleiro em CNF. Devolve a formula e o dicionario placement -> variavel.
+    Cada placement possivel e uma variavel; cada posicao livre coberta por algum placement tem uma
+    variavel equivalente a ser barco, usada nas cardinalidades das rows e cols."""
+    cnf = CNF()
+    lengths = [length for length, count in board.ships.items() if count > 0]
+    placements = {pid: cnf.new_var() for pid in iter_cells(board.fitting_placements(lengths))}
+
+    # frota: exatamente ships[length] barcos de cada comprimento
+    for length in lengths:
+        cnf.exactly([var for pid, var in placements.items() if board.geometry.placements[pid].length == length],
+                    board.ships[length])
+
+    # barcos nao se tocam: no maximo um barco em cada bloco 2x2
+    for window in board.geometry.windows:
+        cnf.at_most_one(var for pid, var in placements.items() if board.geometry.placements[pid].cells & window)
+
+    # posicao e barco sse algum placement a cobre
+    cells = {}
+    for idx in iter_cells(board.free):
+        covering = [var for pid, var in placements.items() if board.geometry.placements[pid].cells & board.geometry.cell[idx]]
+        if not covering:
+            continue
+        cells[idx] = cell = cnf.new_var()
+        cnf.add([-cell] + covering)
+        for var in covering:
+            cnf.add([-var, cell])
+    for idx in iter_cells(board.required):
+        cnf.add([cells[idx]] if idx in cells else [])
+
+    for masks, values in ((board.geometry.row_masks, board.row_values), (board.geometry.col_masks, board.col_values)):
+        for line in range(board.geometry.size):
+            cnf.exactly([cell for idx, cell in cells.items() if masks[line] & board.geometry.cell[idx]], values[line])
+    return cnf, placements
+
+
+def sat_solve(board: Board):
+    """Resolve o tabuleiro com o SAT solver. Devolve o tabuleiro resolvido ou None."""
+    if board.failed:
+        return None
+    cnf, placements = sat_problem(board)
+    model = SATSolver(cnf).solve()
+    if model is None:
+        return None
+    board = copy.deepcopy(board)
+    for pid, var in placements.items():
+        if model[var]:
+            orientation, (row, col), length = board.geometry.placements[pid].action
+            board.insert_ship(orientation, row, col, length)
+    board.insert_waters(board.free)
+    return board
+
+
+SOLVERS = {
+    "search": search_solve,
+    "dlx": exact_cover_solve,
+    "sat": sat_solve,
+}
+
+
+def solve(board: Board, solver: str = "search", search: str = "tree", **options):
+    """Resolve o tabuleiro com o solver escolhido. Devolve o tabuleiro resolvido ou None.
+    options sao as opcoes do problema Bimaru, usadas apenas pelo solver search."""
+    if solver == "search":
+        return search_solve(board, search, **options)
+    return SOLVERS[solver](board)
+
+
+################################################ PORTFOLIO #############################################################
+
+# estrategias da portfolio por omissao, no formato "solver[:search[:order[:canonical]]]"
+PORTFOLIO = (
+    "search:tree:board",
+    "search:trail:reversed:canonical",
+    "search:tree:shuffled",
+    "search:greedy:board",
+    "dlx",
+    "sat",
+)
+
+
+# intervalo (segundos) entre verificacoes de que ainda ha workers da portfolio vivos
+PORTFOLIO_POLL = 0.5
+
+
+def parse_strategy(strategy: str):
+    """Separa a estrategia "solver[:search[:order[:canonical]]]" em (solver, search, order, canonical).
+    Lanca ValueError se algum dos campos nao existir."""
+    fields = strategy.split(":")
+    if len(fields) > 4:
+        raise ValueError(f"estrategia invalida {strategy!r}: demasiados campos")
+    solver, search, order, canonical = (fields + ["tree", "board", ""][len(fields) - 1:])[:4]
+    if solver not in SOLVERS:
+        raise ValueError(f"estrategia invalida {strategy!r}: solver {solver!r} nao existe ({', '.join(SOLVERS)})")
+    if search not in SEARCHES:
+        raise ValueError(f"estrategia invalida {strategy!r}: search {search!r} nao existe ({', '.join(SEARCHES)})")
+    if order not in ORDERINGS:
+        raise ValueError(f"estrategia invalida {strategy!r}: ordem {order!r} nao existe ({', '.join(ORDERINGS)})")
+    if canonical not in ("", "canonical"):
+        raise ValueError(f"estrategia invalida {strategy!r}: o ultimo campo so pode ser 'canonical'")
+    return solver, search, order, canonical == "canonical"
+
+
+def run_strategy(board: Board, strategy: str):
+    """Resolve o tabuleiro com a estrategia "solver[:search[:order[:canonical]]]".
+    Devolve o tabuleiro resolvido ou None."""
+    solver, search, order, canonical = parse_strategy(strategy)
+    if solver == "search":
+        return search_solve(board, search, order=order, canonical=canonical)
+    return SOLVERS[solver](board)
+
+
+def portfolio_worker(instance: Instance, packed: bytes, strategy: str, results):
+    """Envia (estrategia, erro, solucao) para results: erro e None, ou o texto da excecao da estrategia."""
+    try:
+        solution = run_strategy(Board.unpack(instance, packed), strategy)
+    except Exception as error:
+        results.put((strategy, f"{type(error).__name__}: {error}", None))
+        return
+    results.put((strategy, None, None if solution is None else solution.pack()))
+
+
+def portfolio_solve(board: Board, strategies=PORTFOLIO):
+    """Corre cada estrategia num processo separado e devolve (estrategia, solucao) da primeira a acabar,
+    terminando as restantes. Todas as estrategias sao completas, por isso a primeira resposta
+    (mesmo que seja None, sem solucao) e a resposta do tabuleiro.
+    As estrategias que falham sao ignoradas; se todas falharem (ou os seus processos morrerem sem
+    responder) e lancado RuntimeError. Estrategias invalidas dao ValueError antes de criar processos.
+    Os tabuleiros passam entre processos no formato compacto (ver Board.pack)."""
+    strategies = list(strategies)
+    for strategy in strategies:
+        parse_strategy(strategy)
+    results = multiprocessing.Queue()
+    packed = board.pack()
+    workers = [multiprocessing.Process(target=portfolio_worker, args=(board.instance, packed, strategy, results),
+                                       daemon=True)
+               for strategy in strategies]
+    for worker in workers:
+        worker.start()
+    errors = []
+    try:
+        while len(errors) < len(workers):
+            try:
+                strategy, error, solution = results.get(timeout=PORTFOLIO_POLL)
+            except queue.Empty:
+                if any(worker.is_alive() for worker in workers):
+                    continue
+                try:  # uma resposta enviada mesmo antes de o processo acabar
+                    strategy, error, solution = results.get(timeout=PORTFOLIO_POLL)
+                except queue.Empty:
+                    errors.append("processos terminaram sem resposta")
+                    break
+            if error is not None:
+                errors.append(f"{strategy}: {error}")
+                continue
+            return strategy, None if solution is None else Board.unpack(board.instance, solution)
+        raise RuntimeError("todas as estrategias da portfolio falharam: " + "; ".join(errors))
+    finally:
+        for worker in workers:
+            worker.terminate()
+        for worker in workers:
+            worker.join()
+
+
+def format_solution(solution) -> str:
+    """Texto a imprimir para o resultado de solve."""
+    if solution is None:
+        return "No solution found!"
+    return str(solution)
+
+
+################################################ BATCH MODE ############################################################
+
+def split_instances(lines):
+    """Separa uma stream com varias instancias concatenadas: cada instancia comeca na sua linha ROW
+    ou depois de uma linha INSTANCE_DELIMITER. Devolve o texto de cada instancia."""
+    instances = []
+    current = []
+    for line in lines:
+        delimiter = line.strip() == INSTANCE_DELIMITER
+        if (delimiter or line.startswith("ROW")) and current:
+            instances.append("".join(current))
+            current = []
+        if line.strip() and not delimiter:
+            current.append(line)
+    if current:
+        instances.append("".join(current))
+    return instances
+
+
+def read_instances(directory: str):
+    """Texto de cada instancia (ficheiros *.txt) da diretoria, por ordem do nome."""
+    instances = []
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(".txt"):
+            with open(os.path.join(directory, name)) as file:
+                instances.append(file.read())
+    return instances
+
+
+def solve_text(text: str, solver: str = "search", search: str = "tree", options: dict = None) -> str:
+    """Resolve a instancia dada em texto e devolve a solucao formatada.
+    E o trabalho de cada worker do batch mode, por isso recebe e devolve apenas strings."""
+    board = Board.parse_lines(text.splitlines())
+    return format_solution(solve(board, solver, search, **(options or {})))
+
+
+def profile_text(text: str, solver: str = "search", search: str = "tree", options: dict = None):
+    """solve_text sob o profiler. Devolve (solucao formatada, stats, stacks), para o SuiteProfile juntar."""
+    return profile_call(solve_text, text, solver, search, options)
+
+
+def solve_batch(instances, solver: str = "search", search: str = "tree", jobs: int = None, options: dict = None,
+                profile: SuiteProfile = None):
+    """Resolve as instancias (em texto) num pool de processos, um por core.
+    Cada worker fica ativo entre instancias, e as solucoes sao devolvidas pela ordem de entrada.
+    Com profile, cada instancia e perfilada no seu worker e os resultados sao juntos em profile."""
+    instances = list(instances)
+    if not instances:
+        return []
+    jobs = min(jobs or os.cpu_count() or 1, len(instances))
+    worker = solve_text if profile is None else profile_text
+    if jobs == 1:
+        results = [worker(text, solver, search, options) for text in instances]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            results = list(executor.map(worker, instances, itertools.repeat(solver), itertools.repeat(search),
+                                        itertools.repeat(options)))
+    if profile is None:
+        return results
+    for _, stats, stacks in results:
+        profile.add(stats, stacks)
+    return [output for output, _, _ in results]
+
+
 if __name__ == "__main__":
 
-    # Read the board from stdin
-    board = Board.parse_instance()
+    parser = argparse.ArgumentParser(description="Resolve uma instancia de Bimaru lida do stdin.")
+    parser.add_argument("--solver", choices=SOLVERS, default="search",
+                        help="search: procura em arvore sobre o problema Bimaru; "
+                             "dlx: exact cover (Algorithm X) sobre os placements possiveis; "
+                             "sat: CNF resolvida com o SAT solver CDCL")
+    parser.add_argument("--search", choices=SEARCHES, default="tree",
+                        help="tree: copia o tabuleiro em cada sucessor; "
+                             "trail: altera um unico tabuleiro e desfaz as jogadas no backtrack")
+    parser.add_argument("--canonical", action="store_true",
+                        help="coloca os barcos do mesmo comprimento por ordem crescente de posicao, "
+                             "evitando repetir o mesmo conjunto de barcos por outra ordem")
+    parser.add_argument("--branching", choices=BRANCHINGS, default="largest",
+                        help="largest: ramifica em todos os placements do maior barco por colocar; "
+                             "constrained: ramifica na posicao obrigatoria ou linha com menos placements")
+    parser.add_argument("--vectorized", action="store_true",
+                        help="calcula os placements de cada no com NumPy, com janelas deslizantes sobre os "
+                             "valores das rows e cols, em vez de os testar um a um (mais rapido so em "
+                             "tabuleiros maiores que 10x10)")
+    parser.add_argument("--heuristic", default="ships,hints,lines",
+                        help="estimadores da heuristica (separados por virgulas, de %s) usados por greedy, "
+                             "astar e rbfs; so moves (com lines) e admissivel, ships e hints contam barcos e nao "
+                             "acoes" % ", ".join(ESTIMATORS))
+    parser.add_argument("--parentless", action="store_true",
+                        help="os nos da procura nao guardam o parent (so o tabuleiro final e impresso), "
+                             "reduzindo a memoria da fronteira; usado por %s" % ", ".join(PARENTLESS_SEARCHES))
+    parser.add_argument("--telemetry", metavar="FILE",
+                        help="escreve as estatisticas da procura (tempos por metodo, nos por profundidade, "
+                             "branching, fronteira maxima, nos/s) em FILE, em CSV se acabar em .csv, senao JSON; "
+                             "so com --solver search, a resolver uma instancia (sem --all, --unique, --portfolio, "
+                             "--batch nem --stream)")
+    parser.add_argument("--all", action="store_true",
+                        help="imprime todas as solucoes, separadas por uma linha vazia, a medida que sao encontradas")
+    parser.add_argument("--unique", action="store_true",
+                        help="verifica se a solucao e unica: imprime-a se for, e sai com codigo 1 se nao houver "
+                             "solucao ou houver mais do que uma")
+    parser.add_argument("--portfolio", nargs="?", const=",".join(PORTFOLIO), metavar="STRATEGIES",
+                        help="corre as estrategias (separadas por virgulas, no formato "
+                             "solver[:search[:order[:canonical]]]) "
+                             "em paralelo e usa a primeira solucao; por omissao " + ",".join(PORTFOLIO))
+    parser.add_argument("--batch", nargs="?", const="-", metavar="DIR",
+                        help="resolve varias instancias: os ficheiros *.txt de DIR, ou (sem DIR) as instancias "
+                             "concatenadas no stdin; as solucoes saem pela ordem de entrada, separadas por uma linha vazia")
+    parser.add_argument("--jobs", type=int, default=None,
+                        help="numero de processos do batch mode (por omissao um por core)")
+    parser.add_argument("--stream", action="store_true",
+                        help="le instancias do stdin separadas por linhas '%s' e imprime cada solucao, "
+                             "seguida da mesma linha, assim que a resolve" % INSTANCE_DELIMITER)
+    parser.add_argument("--profile", metavar="FILE",
+                        help="perfila cada instancia resolvida (tambem em --batch e --stream), junta os resultados "
+                             "e escreve-os em FILE (pstats) e nas stacks colapsadas de FILE com extensao .folded "
+                             "(para flame graphs); imprime no stderr as funcoes de bimaru.py e search.py")
+    args = parser.parse_args()
+    options = {"canonical": args.canonical, "heuristic": tuple(args.heuristic.split(",")),
+               "branching": args.branching, "vectorized": args.vectorized, "parentless": args.parentless}
+    profile = SuiteProfile() if args.profile else None
+    for strategy in (args.portfolio.split(",") if args.portfolio else []):
+        try:
+            parse_strategy(strategy)
+        except ValueError as error:
+            parser.error(str(error))
+    for name in options["heuristic"]:
+        if name not in ESTIMATORS:
+            parser.error("estimador desconhecido: %r (escolher de %s)" % (name, ", ".join(ESTIMATORS)))
+    if args.telemetry is not None:
+        if args.solver != "search":
+            parser.error("--telemetry so e suportado com --solver search")
+        modes = [flag for flag, used in (("--all", args.all), ("--unique", args.unique),
+                                         ("--portfolio", args.portfolio), ("--batch", args.batch is not None),
+                                         ("--stream", args.stream)) if used]
+        if modes:
+            parser.error("--telemetry nao e suportado com " + ", ".join(modes))
+
+    def run(func, *func_args):
+        """Chama func, sob o profiler quando --profile foi dado."""
+        if profile is None:
+            return func(*func_args)
+        return profile.call(func, *func_args)
+
+    def finish(code=0):
+        if profile is not None:
+            profile.write(args.profile)
+            profile.print_breakdown()
+        sys.exit(code)
+
+    def solve_stream():
+        for board in Board.stream_instances():
+            print(format_solution(solve(board, args.solver, args.search, **options)))
+            print(INSTANCE_DELIMITER, flush=True)
+        return 0
+
+    def solve_stdin():
+        # Read the board from stdin
+        board = Board.parse_instance()
+
+        if args.all:
+            for index, solution in enumerate(search_solutions(board)):
+                print(("\n" if index else "") + str(solution), flush=True)
+            return 0
+
+        if args.unique:
+            count, solution = unique_solution(board)
+            print("Multiple solutions found!" if count > 1 else format_solution(solution))
+            return 0 if count == 1 else 1
+
+        # Solve the problem
+        if args.portfolio:
+            try:
+                strategy, solution = portfolio_solve(board, args.portfolio.split(","))
+            except RuntimeError as error:
+                print(error, file=sys.stderr)
+                return 1
+        else:
+            solution = solve(board, args.solver, args.search, telemetry=args.telemetry, **options)
 
-    # Create the initial state
-    initial_state = BimaruState(board)
+        # Imprimir a solução para o standard output no formato indicado.
+        print(format_solution(solution))
+        return 0
 
-    # Create the Bimaru problem
-    problem = Bimaru(initial_state)
-    # Solve the problem
-    solution_node = depth_first_tree_search(problem)
+    if args.batch is not None:
+        instances = split_instances(sys.stdin) if args.batch == "-" else read_instances(args.batch)
+        print("\n\n".join(solve_batch(instances, args.solver, args.search, args.jobs, options, profile)))
+        finish()
 
-    # Retirar a solução a partir do nó resultante,
-    # Imprimir para o standard output no formato indicado.
-    if solution_node is None:
-        print("No solution found!")
-    else:
-        print(solution_node.state.board)
+    finish(run(solve_stream if args.stream else solve_stdin))
@@ -1,5 +1,4 @@
 import pstats
 
 p = pstats.Stats('output.pstats')
-p.strip_dirs().sort_stats('cumulative').print_stats('bimaru\.py')
-
+p.strip_dirs().sort_stats('cumulative').print_stats(r'(bimaru|search)\.py')
@@ -0,0 +1,205 @@
+"""
+Benchmark dos solvers de bimaru.py sobre todas as instancias de test-instances/instances-students e
+random_instances.
+
+Cada instancia e resolvida por cada solver (no formato solver[:search], como search:tree, search:trail,
+dlx ou sat) --repeat vezes no mesmo processo. Para cada par e guardada a mediana e o minimo do tempo
+(parse + resolucao), os nos expandidos (so para o solver search) e o pico de memoria alocada (numa
+execucao extra com tracemalloc, para nao afetar os tempos). A solucao e comparada com o .out da
+instancia ou, quando nao existe, verificada contra as regras do jogo.
+
+Com --save-baseline os resultados ficam em baseline.json; nas execucoes seguintes o script falha
+(codigo 1) se alguma solucao estiver errada, se um tempo piorar mais do que --margin (mais --slack
+segundos, para as instancias muito rapidas) ou se o numero de nos aumentar.
+
+    python code_analysis/benchmark.py --repeat 5 --save-baseline
+    python code_analysis/benchmark.py --repeat 5
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bimaru import FLEET, SEARCHES, SOLVERS, Bimaru, BimaruState, Board, format_solution  # noqa: E402
+from search import InstrumentedProblem  # noqa: E402
+
+INSTANCE_DIRS = (
+    os.path.join(ROOT, "test-instances", "instances-students"),
+    os.path.join(ROOT, "random_instances"),
+)
+SOLVER_CONFIGS = ("search:tree", "search:trail", "dlx", "sat")
+BASELINE = os.path.join(ROOT, "code_analysis", "baseline.json")
+
+
+def instance_paths():
+    for directory in INSTANCE_DIRS:
+        for name in sorted(os.listdir(directory)):
+            if name.endswith(".txt"):
+                yield os.path.join(directory, name)
+
+
+def run_once(text: str, config: str):
+    """Resolve a instancia com o solver da config. Devolve (solucao formatada, nos expandidos ou None)."""
+    solver, _, search = config.partition(":")
+    board = Board.parse_lines(text.splitlines())
+    if solver == "search":
+        problem = InstrumentedProblem(Bimaru(BimaruState(board)))
+        node = SEARCHES[search or "tree"](problem)
+        return format_solution(node.state.board if node else None), problem.succs
+    return format_solution(SOLVERS[solver](board)), None
+
+
+def valid_solution(text: str, output: str) -> bool:
+    """Verifica a solucao contra a instancia: contagens das rows e cols, hints, frota e barcos sem se tocarem."""
+    rows = cols = None
+    fleet = dict(FLEET)
+    hints = []
+    for line in text.splitlines():
+        fields = line.split()
+        if not fields:
+            continue
+        if fields[0] == "ROW":
+            rows = [int(x) for x in fields[1:]]
+        elif fields[0] == "COLUMN":
+            cols = [int(x) for x in fields[1:]]
+        elif fields[0] == "FLEET":
+            fleet = {length: int(x) for length, x in enumerate(fields[1:], 1) if int(x) > 0}
+        elif fields[0] == "HINT":
+            hints.append((int(fields[1]), int(fields[2]), fields[3]))
+
+    grid = output.split()
+    size = len(rows)
+    if len(grid) != size or any(len(line) != size for line in grid):
+        return False
+
+    def ship(row, col):
+        return 0 <= row < size and 0 <= col < size and grid[row][col] not in ".wW"
+
+    if [sum(ship(row, col) for col in range(size)) for row in range(size)] != rows:
+        return False
+    if [sum(ship(row, col) for row in range(size)) for col in range(size)] != cols:
+        return False
+    if any(grid[row][col].upper() != piece for row, col, piece in hints):
+        return False
+
+    ships = Counter()
+    for row in range(size):
+        for col in range(size):
+            if not ship(row, col):
+                continue
+            if ship(row - 1, col - 1) or ship(row - 1, col + 1):  # barcos na diagonal tocam-se
+                return False
+            if ship(row - 1, col) or ship(row, col - 1):  # nao e o inicio do barco
+                continue
+            if ship(row + 1, col) and ship(row, col + 1):
+                return False
+            step = (1, 0) if ship(row + 1, col) else (0, 1)
+            length = 1
+            while ship(row + length * step[0], col + length * step[1]):
+                length += 1
+            ships[length] += 1
+    return dict(ships) == fleet
+
+
+def check(path: str, text: str, output: str) -> str:
+    expected = path[:-4] + ".out"
+    if os.path.exists(expected):
+        with open(expected) as file:
+            return "OK" if output.strip() == file.read().strip() else "DIFF"
+    return "OK" if valid_solution(text, output) else "INVALID"
+
+
+def benchmark(configs, repeat: int):
+    results = {}
+    for path in instance_paths():
+        with open(path) as file:
+            text = file.read()
+        name = os.path.relpath(path, ROOT)
+        for config in configs:
+            times = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                output, nodes = run_once(text, config)
+                times.append(time.perf_counter() - start)
+
+            tracemalloc.start()
+            run_once(text, config)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            results[f"{name}|{config}"] = {
+                "time": statistics.median(times),
+                "min_time": min(times),
+                "nodes": nodes,
+                "peak_kib": peak / 1024,
+                "status": check(path, text, output),
+            }
+    return results
+
+
+def regressions(results, baseline, margin: float, slack: float):
+    """Lista de problemas: solucoes erradas, e tempos ou nos piores do que na baseline."""
+    problems = []
+    for key, result in results.items():
+        if result["status"] != "OK":
+            problems.append(f"{key}: solution {result['status']}")
+        base = baseline.get(key)
+        if base is None:
+            continue
+        limit = base["time"] * (1 + margin) + slack
+        if result["time"] > limit:
+            problems.append(f"{key}: time {result['time']:.4f}s > {limit:.4f}s (baseline {base['time']:.4f}s)")
+        if result["nodes"] is not None and base["nodes"] is not None and result["nodes"] > base["nodes"]:
+            problems.append(f"{key}: nodes {result['nodes']} > baseline {base['nodes']}")
+    return problems
+
+
+def print_table(results):
+    print(f"{'instance':50s} {'solver':14s} {'median':>9s} {'min':>9s} {'nodes':>7s} {'peak KiB':>9s}  status")
+    for key, result in results.items():
+        name, config = key.split("|")
+        nodes = "-" if result["nodes"] is None else result["nodes"]
+        print(f"{name:50s} {config:14s} {result['time']:9.4f} {result['min_time']:9.4f} {nodes:>7} "
+              f"{result['peak_kib']:9.1f}  {result['status']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark dos solvers de Bimaru com regression gate.")
+    parser.add_argument("--solvers", default=",".join(SOLVER_CONFIGS),
+                        help="configuracoes solver[:search] separadas por virgulas")
+    parser.add_argument("--repeat", type=int, default=3, help="execucoes por instancia e solver")
+    parser.add_argument("--baseline", default=BASELINE, help="ficheiro JSON da baseline")
+    parser.add_argument("--save-baseline", action="store_true", help="guarda os resultados como baseline")
+    parser.add_argument("--margin", type=float, default=0.25, help="aumento relativo de tempo tolerado")
+    parser.add_argument("--slack", type=float, default=0.005, help="aumento absoluto de tempo tolerado (s)")
+    parser.add_argument("--json", metavar="FILE", help="escreve tambem os resultados em FILE")
+    args = parser.parse_args()
+
+    results = benchmark(args.solvers.split(","), args.repeat)
+    print_table(results)
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as file:
+            json.dump(results, file, indent=2)
+        print(f"baseline saved to {args.baseline}")
+        sys.exit(0)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+    problems = regressions(results, baseline, args.margin, args.slack)
+    for problem in problems:
+        print("REGRESSION", problem)
+    sys.exit(1 if problems else 0)
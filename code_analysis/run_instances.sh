@@ -4,17 +4,12 @@ GREEN='\033[0;32m'  # ANSI escape sequence for green color
 NC='\033[0m'        # ANSI escape sequence to reset color
 
 # Clean previous profiling data
-rm -f output.pstats
-
-for i in {01..09}
-do
-   echo "Testing instance$i..."
-   # Run Python script with cProfile, appending to output.pstats
-   python3 -m cProfile -o output.pstats ../bimaru.py < ../instances-students/instance${i}.txt > ../instances-students/my_output.out 2>&1
-   if [ $? -eq 0 ]; then
-	   echo -e "${GREEN}OK!${NC}"
-	   echo "------------------------------------------------------------"
-	   # Extract the user time from the time command's output
-   fi
-done
-
+rm -f output.pstats output.folded
+
+# Profile every instance in one run: the stats of all instances are merged into output.pstats,
+# and the collapsed stacks (for flame graphs) are written to output.folded
+python3 ../bimaru.py --batch ../test-instances/instances-students --jobs 1 --profile output.pstats > my_output.out
+if [ $? -eq 0 ]; then
+    echo -e "${GREEN}OK!${NC}"
+    echo "------------------------------------------------------------"
+fi
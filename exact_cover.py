@@ -0,0 +1,107 @@
+"""
+Exact cover (Algorithm X)
+
+Generalised exact cover solver. Every primary item has a demand and every
+option covers some items with a weight; a solution is a set of options whose
+weights add up exactly to the demand of each primary item, while each
+secondary item is covered at most once.
+
+The links of Dancing Links are kept as a dict from each item to the set of
+options still active for it, which gives the same cheap cover/uncover
+operations in Python.
+"""
+
+
+class ExactCover:
+    """Generalised exact cover problem.
+    options maps an option name to a dict {item: weight}; demands maps each
+    primary item to the total weight it must receive. Items of an option that
+    are not in demands are secondary: at most one chosen option may use them.
+    >>> problem = ExactCover({'a': {1: 1}, 'b': {1: 1, 2: 1}, 'c': {2: 1}}, {1: 1, 2: 1})
+    >>> sorted(map(sorted, problem.solutions()))
+    [['a', 'c'], ['b']]
+    """
+
+    def __init__(self, options, demands):
+        self.options = options
+        self.demands = dict(demands)
+        self.active = {item: set() for item in self.demands}
+        for option, items in options.items():
+            for item in items:
+                self.active.setdefault(item, set()).add(option)
+        # options that no longer fit their primary items are never usable
+        for option, items in options.items():
+            if any(weight > self.demands[item] for item, weight in items.items() if item in self.demands):
+                self.deactivate(option)
+        self.solution = []
+
+    def deactivate(self, option):
+        for item in self.options[option]:
+            self.active[item].discard(option)
+
+    def activate(self, option):
+        for item in self.options[option]:
+            self.active[item].add(option)
+
+    def select(self, option):
+        """Add option to the solution and remove every option that became
+        incompatible with it. Return the removed options, so that
+        self.unselect can put them back."""
+        removed = [option]
+        self.deactivate(option)
+        for item, weight in self.options[option].items():
+            if item in self.demands:
+                self.demands[item] -= weight
+                left = self.demands[item]
+                conflicts = [other for other in self.active[item] if self.options[other][item] > left]
+            else:
+                conflicts = list(self.active[item])
+            for other in conflicts:
+                self.deactivate(other)
+            removed.extend(conflicts)
+        self.solution.append(option)
+        return removed
+
+    def unselect(self, option, removed):
+        self.solution.pop()
+        for item, weight in self.options[option].items():
+            if item in self.demands:
+                self.demands[item] += weight
+        for other in reversed(removed):
+            self.activate(other)
+
+    def choose_item(self):
+        """Return the primary item with unmet demand that has the fewest active
+        options (None when every demand is met)."""
+        best, best_count = None, None
+        for item, demand in self.demands.items():
+            if demand > 0:
+                count = len(self.active[item])
+                if best is None or count < best_count:
+                    best, best_count = item, count
+        return best
+
+    def solutions(self):
+        """Yield every solution, as a list of option names."""
+        item = self.choose_item()
+        if item is None:
+            yield list(self.solution)
+            return
+        candidates = sorted(self.active[item])
+        if sum(self.options[option][item] for option in candidates) < self.demands[item]:
+            return
+
+        tried = []
+        for option in candidates:
+            removed = self.select(option)
+            yield from self.solutions()
+            self.unselect(option, removed)
+            # the next branches are the solutions without this option
+            self.deactivate(option)
+            tried.append(option)
+        for option in reversed(tried):
+            self.activate(option)
+
+    def solve(self):
+        """Return the first solution found, or None."""
+        return next(self.solutions(), None)
@@ -0,0 +1,80 @@
+"""
+Heuristics for the Bimaru problem
+
+Every estimator takes a Board and returns an estimate of the work left, and
+the estimators are combined by taking their maximum. They only read counters
+that Board already keeps up to date, so each evaluation costs O(1) instead of
+a pass over the board.
+
+The path cost counts actions, but propagation places forced ships for free,
+so a single action can finish several ships. The estimators that count ships
+(ships, hints) are therefore not admissible: they guide greedy and A*
+towards boards with fewer ships left rather than bound the actions still
+needed, and A* with them is not guaranteed to return the cheapest path. The
+only bound in actions that holds on every board is moves (one action for any
+unfinished board), together with lines, which only flags boards with no
+solution.
+
+Heuristic is the h function used by the informed searches. It keeps the
+value of a node from dropping faster than the path cost grows (pathmax): the
+parent's value is read from the slot where search.memoize stores it
+(node.h). It is a plain class holding the estimator names, so problems that
+use it can be pickled and sent to worker processes.
+"""
+
+import math
+
+
+def moves_left(board):
+    """One for a board with ships still to be placed, zero otherwise: an
+    unfinished board needs at least one more action."""
+    return 1 if any(board.ships.values()) else 0
+
+
+def ships_left(board):
+    """Number of ships still to be placed (not admissible, see above)."""
+    return sum(board.ships.values())
+
+
+def dead_lines(board):
+    """Infinite when a row or column can no longer get its pieces (fewer free
+    positions than pieces left) or propagation found a contradiction: such a
+    board has no solution. Zero otherwise."""
+    return math.inf if board.short_lines or board.failed else 0
+
+
+def unmatched_hints(board):
+    """Positions that hints (or propagation) require to be ship and that no
+    ship covers yet, divided by the longest ship left: at least that many
+    ships are still needed to cover them (not admissible, see above)."""
+    required = board.required.bit_count()
+    if not required:
+        return 0
+    longest = max((length for length, count in board.ships.items() if count > 0), default=0)
+    if not longest:
+        return math.inf
+    return -(-required // longest)
+
+
+ESTIMATORS = {
+    "moves": moves_left,
+    "ships": ships_left,
+    "lines": dead_lines,
+    "hints": unmatched_hints,
+}
+
+
+class Heuristic:
+    """h(node): the maximum of the named estimators on the board of
+    node.state, raised to the parent's memoised value minus the step cost."""
+
+    def __init__(self, names=("ships", "hints", "lines")):
+        self.names = tuple(names)
+        self.estimators = [ESTIMATORS[name] for name in self.names]
+
+    def __call__(self, node):
+        value = max(estimator(node.state.board) for estimator in self.estimators)
+        parent = node.parent
+        if parent is not None and hasattr(parent, "h"):
+            value = max(value, parent.h - (node.path_cost - parent.path_cost))
+        return value
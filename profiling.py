@@ -0,0 +1,120 @@
+"""
+Suite profiling
+
+Profiles every instance solved in a run and merges the results, so that hot
+spots can be found across a whole set of instances instead of the last one.
+Each call runs under cProfile and, at the same time, under a stack sampler
+(a thread that reads the frames of the profiled thread at a fixed interval),
+which gives the collapsed stacks that flame graph tools read, one
+"frame;frame;...;frame count" line per distinct stack.
+
+profile_call returns plain data (the raw cProfile dict and a Counter of
+stacks), so process pool workers can profile their instances and send the
+results back to be merged by a SuiteProfile in the parent.
+"""
+
+import cProfile
+import os
+import pstats
+import sys
+import threading
+from collections import Counter
+
+SAMPLE_INTERVAL = 0.001
+
+# functions shown in the breakdown (regex over "path:line(function)")
+BREAKDOWN = r"(bimaru|search)\.py:"
+
+
+def frame_name(code):
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+class StackSampler(threading.Thread):
+    """Samples the stack of the thread with the given ident every interval
+    seconds, counting each stack below a frame of root (a code object).
+    Samples taken outside root are dropped."""
+
+    def __init__(self, ident, root, interval=SAMPLE_INTERVAL):
+        super().__init__(daemon=True)
+        self.target = ident
+        self.root = root
+        self.interval = interval
+        self.stacks = Counter()
+        self.done = threading.Event()
+
+    def run(self):
+        while not self.done.wait(self.interval):
+            frame = sys._current_frames().get(self.target)
+            stack = []
+            while frame is not None and frame.f_code is not self.root:
+                stack.append(frame_name(frame.f_code))
+                frame = frame.f_back
+            if frame is not None and stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self.done.set()
+        self.join()
+
+
+def sampled_call(func, args, kwargs):
+    """Root frame of the sampled stacks."""
+    return func(*args, **kwargs)
+
+
+def profile_call(func, *args, **kwargs):
+    """Run func(*args, **kwargs) under cProfile and the stack sampler.
+    Return (result, stats, stacks): the raw cProfile stats dict and a Counter
+    of collapsed stacks, both picklable."""
+    profiler = cProfile.Profile()
+    sampler = StackSampler(threading.get_ident(), sampled_call.__code__)
+    # the sampler only runs when the profiled thread releases the GIL
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(SAMPLE_INTERVAL)
+    sampler.start()
+    try:
+        result = profiler.runcall(sampled_call, func, args, kwargs)
+    finally:
+        sampler.stop()
+        sys.setswitchinterval(switch_interval)
+    profiler.create_stats()
+    return result, profiler.stats, sampler.stacks
+
+
+class SuiteProfile:
+    """cProfile stats and collapsed stacks merged over many calls."""
+
+    def __init__(self):
+        self.stats = pstats.Stats()
+        self.stacks = Counter()
+        self.calls = 0
+
+    def add(self, stats, stacks):
+        """Merge the results of a profile_call."""
+        other = pstats.Stats()
+        other.stats = stats
+        other.get_top_level_stats()
+        self.stats.add(other)
+        self.stacks.update(stacks)
+        self.calls += 1
+
+    def call(self, func, *args, **kwargs):
+        """Profile func(*args, **kwargs) in this process and return its result."""
+        result, stats, stacks = profile_call(func, *args, **kwargs)
+        self.add(stats, stacks)
+        return result
+
+    def write(self, path):
+        """Write the merged stats to path (pstats format) and the collapsed
+        stacks to the same path with the extension .folded."""
+        self.stats.dump_stats(path)
+        with open(os.path.splitext(path)[0] + ".folded", "w") as file:
+            for stack, count in self.stacks.most_common():
+                file.write(f"{stack} {count}\n")
+
+    def print_breakdown(self, stream=sys.stderr, sort="tottime", limit=30):
+        """Print the functions of bimaru.py and search.py, sorted by sort."""
+        print(f"Profile merged over {self.calls} call(s)", file=stream)
+        self.stats.stream = stream
+        self.stats.sort_stats(sort).print_stats(BREAKDOWN, limit)
@@ -0,0 +1,326 @@
+"""
+Propositional satisfiability
+
+A CNF builder with cardinality constraints and a conflict-driven clause
+learning (CDCL) solver: two watched literals for unit propagation, first-UIP
+conflict analysis, VSIDS decision heuristic with phase saving, and Luby
+restarts. Variables are positive integers and literals are non-zero integers
+(-v is the negation of v), as in the DIMACS format.
+"""
+
+import heapq
+
+
+class CNF:
+    """A formula in conjunctive normal form, with helpers to add
+    cardinality constraints through auxiliary variables."""
+
+    def __init__(self):
+        self.num_vars = 0
+        self.clauses = []
+
+    def new_var(self):
+        self.num_vars += 1
+        return self.num_vars
+
+    def add(self, clause):
+        self.clauses.append(list(clause))
+
+    def counter(self, lits, k):
+        """Sequential counter over lits: return k variables, the j-th of which
+        is true exactly when at least j + 1 of lits are true."""
+        previous = []
+        for lit in lits:
+            current = [self.new_var() for _ in range(k)]
+            for j, register in enumerate(current):
+                before = previous[j] if j < len(previous) else None
+                carry = previous[j - 1] if 0 < j <= len(previous) else None
+                # register <-> before or (lit and carry), with carry true for j == 0
+                if before is not None:
+                    self.add([-before, register])
+                    self.add([-register, before, lit])
+                else:
+                    self.add([-register, lit])
+                if j == 0:
+                    self.add([-lit, register])
+                elif carry is not None:
+                    self.add([-lit, -carry, register])
+                    self.add([-register, before, carry] if before is not None else [-register, carry])
+                else:
+                    self.add([-register])
+            previous = current
+        return previous + [None] * (k - len(previous))
+
+    def at_most_one(self, lits):
+        """At most one of lits is true (pairwise encoding, no auxiliary variables)."""
+        lits = list(lits)
+        for i, lit in enumerate(lits):
+            for other in lits[i + 1:]:
+                self.add([-lit, -other])
+
+    def at_most(self, lits, k):
+        """At most k of lits are true."""
+        lits = list(lits)
+        if k >= len(lits):
+            return
+        if k == 0:
+            for lit in lits:
+                self.add([-lit])
+            return
+        self.add([-self.counter(lits, k + 1)[k]])
+
+    def at_least(self, lits, k):
+        """At least k of lits are true."""
+        lits = list(lits)
+        if k <= 0:
+            return
+        if k > len(lits):
+            self.add([])
+            return
+        self.add([self.counter(lits, k)[k - 1]])
+
+    def exactly(self, lits, k):
+        """Exactly k of lits are true."""
+        lits = list(lits)
+        if k <= 0 or k >= len(lits):
+            self.at_most(lits, k)
+            self.at_least(lits, k)
+            return
+        registers = self.counter(lits, k + 1)
+        self.add([registers[k - 1]])
+        self.add([-registers[k]])
+
+
+def luby(i):
+    """The i-th element (from 1) of the Luby sequence 1, 1, 2, 1, 1, 2, 4, ..."""
+    k = 1
+    while (1 << k) - 1 < i:
+        k += 1
+    while i != (1 << k) - 1:
+        i -= (1 << (k - 1)) - 1
+        k = 1
+        while (1 << k) - 1 < i:
+            k += 1
+    return 1 << (k - 1)
+
+
+class SATSolver:
+    """CDCL solver for a CNF.
+    >>> cnf = CNF()
+    >>> a, b, c = cnf.new_var(), cnf.new_var(), cnf.new_var()
+    >>> cnf.add([a, b]); cnf.add([-a, c]); cnf.add([-c]); cnf.exactly([a, b, c], 1)
+    >>> model = SATSolver(cnf).solve()
+    >>> [model[v] for v in (a, b, c)]
+    [False, True, False]
+    """
+
+    def __init__(self, cnf, restart_base=100, decay=0.95):
+        self.num_vars = cnf.num_vars
+        self.clauses = []
+        self.watches = {}
+        # indexed by literal (negative literals wrap around): 1 true, -1 false, 0 unassigned
+        self.values = [0] * (2 * self.num_vars + 1)
+        self.levels = [0] * (self.num_vars + 1)
+        self.reasons = [None] * (self.num_vars + 1)
+        self.phases = [-1] * (self.num_vars + 1)
+        self.activity = [0.0] * (self.num_vars + 1)
+        self.increment = 1.0
+        self.decay = decay
+        self.restart_base = restart_base
+        self.heap = [(0.0, var) for var in range(1, self.num_vars + 1)]
+        self.trail = []
+        self.trail_limits = []
+        self.queue_head = 0
+        self.conflicts = 0
+        self.unsatisfiable = False
+        for clause in cnf.clauses:
+            self.add_clause(clause)
+
+    # Assignments
+
+    def value(self, lit):
+        return self.values[lit]
+
+    def level(self):
+        return len(self.trail_limits)
+
+    def assign(self, lit, reason):
+        var = abs(lit)
+        self.values[lit] = 1
+        self.values[-lit] = -1
+        self.levels[var] = len(self.trail_limits)
+        self.reasons[var] = reason
+        self.trail.append(lit)
+
+    def backtrack(self, level):
+        if self.level() <= level:
+            return
+        limit = self.trail_limits[level]
+        for lit in self.trail[limit:]:
+            var = abs(lit)
+            self.phases[var] = self.values[var]
+            self.values[var] = self.values[-var] = 0
+            self.reasons[var] = None
+            heapq.heappush(self.heap, (-self.activity[var], var))
+        del self.trail[limit:]
+        del self.trail_limits[level:]
+        self.queue_head = min(self.queue_head, limit)
+
+    # Clauses
+
+    def watch(self, lit, clause):
+        self.watches.setdefault(lit, []).append(clause)
+
+    def add_clause(self, clause):
+        """Add an original clause (only before solving, at level 0)."""
+        clause = list(dict.fromkeys(clause))
+        if any(-lit in clause for lit in clause) or any(self.value(lit) > 0 for lit in clause):
+            return
+        clause = [lit for lit in clause if self.value(lit) == 0]
+        if not clause:
+            self.unsatisfiable = True
+        elif len(clause) == 1:
+            self.assign(clause[0], None)
+            if self.propagate() is not None:
+                self.unsatisfiable = True
+        else:
+            self.clauses.append(clause)
+            self.watch(clause[0], clause)
+            self.watch(clause[1], clause)
+
+    def propagate(self):
+        """Unit propagation over the watched literals. Return a conflicting
+        clause, or None."""
+        values = self.values
+        watches = self.watches
+        trail = self.trail
+        while self.queue_head < len(trail):
+            false_lit = -trail[self.queue_head]
+            self.queue_head += 1
+            watchers = watches.get(false_lit)
+            if not watchers:
+                continue
+            kept = []
+            for i, clause in enumerate(watchers):
+                if clause[0] == false_lit:
+                    clause[0], clause[1] = clause[1], false_lit
+                first = clause[0]
+                if values[first] > 0:
+                    kept.append(clause)
+                    continue
+                for j in range(2, len(clause)):
+                    lit = clause[j]
+                    if values[lit] >= 0:
+                        clause[1], clause[j] = lit, false_lit
+                        if lit in watches:
+                            watches[lit].append(clause)
+                        else:
+                            watches[lit] = [clause]
+                        break
+                else:
+                    kept.append(clause)
+                    if values[first] < 0:
+                        kept.extend(watchers[i + 1:])
+                        watches[false_lit] = kept
+                        return clause
+                    self.assign(first, clause)
+            watches[false_lit] = kept
+        return None
+
+    # Conflict analysis
+
+    def bump(self, var):
+        self.activity[var] += self.increment
+        if self.activity[var] > 1e100:
+            self.activity = [activity * 1e-100 for activity in self.activity]
+            self.increment *= 1e-100
+            self.heap = [(-self.activity[v], v) for v in range(1, self.num_vars + 1) if not self.values[v]]
+            heapq.heapify(self.heap)
+        elif not self.values[var]:
+            heapq.heappush(self.heap, (-self.activity[var], var))
+
+    def analyze(self, conflict):
+        """First-UIP conflict analysis. Return the learned clause (asserting
+        literal first) and the level to backtrack to."""
+        learned = [None]
+        seen = set()
+        pending = 0
+        lit = None
+        index = len(self.trail)
+        clause = conflict
+        while True:
+            for other in clause:
+                if other == lit:
+                    continue
+                var = abs(other)
+                if var in seen or self.levels[var] == 0:
+                    continue
+                seen.add(var)
+                self.bump(var)
+                if self.levels[var] == self.level():
+                    pending += 1
+                else:
+                    learned.append(other)
+            # next literal of the current level on the trail
+            while True:
+                index -= 1
+                lit = self.trail[index]
+                if abs(lit) in seen:
+                    break
+            pending -= 1
+            if pending == 0:
+                break
+            clause = self.reasons[abs(lit)]
+        learned[0] = -lit
+        self.increment /= self.decay
+
+        if len(learned) == 1:
+            return learned, 0
+        # the literal of the highest remaining level is watched next to the asserting one
+        best = max(range(1, len(learned)), key=lambda i: self.levels[abs(learned[i])])
+        learned[1], learned[best] = learned[best], learned[1]
+        return learned, self.levels[abs(learned[1])]
+
+    # Search
+
+    def decide(self):
+        """Pick the unassigned variable of highest activity (None if all are
+        assigned) and assign it its saved phase."""
+        while self.heap:
+            _, var = heapq.heappop(self.heap)
+            if not self.values[var]:
+                self.trail_limits.append(len(self.trail))
+                self.assign(var if self.phases[var] > 0 else -var, None)
+                return var
+        return None
+
+    def solve(self):
+        """Return a model as a dict {var: bool}, or None if unsatisfiable."""
+        if self.unsatisfiable:
+            return None
+        restarts = 1
+        limit = self.restart_base * luby(restarts)
+        conflicts_since_restart = 0
+        while True:
+            conflict = self.propagate()
+            if conflict is not None:
+                self.conflicts += 1
+                conflicts_since_restart += 1
+                if self.level() == 0:
+                    return None
+                learned, level = self.analyze(conflict)
+                self.backtrack(level)
+                if len(learned) == 1:
+                    self.assign(learned[0], None)
+                else:
+                    self.clauses.append(learned)
+                    self.watch(learned[0], learned)
+                    self.watch(learned[1], learned)
+                    self.assign(learned[0], learned)
+            elif conflicts_since_restart >= limit:
+                restarts += 1
+                limit = self.restart_base * luby(restarts)
+                conflicts_since_restart = 0
+                self.backtrack(0)
+            elif self.decide() is None:
+                return {var: self.values[var] > 0 for var in range(1, self.num_vars + 1)}
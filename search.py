@@ -6,8 +6,14 @@ then create problem instances and solve them with calls to the various search
 functions.
 """
 
+import csv
+import json
+import multiprocessing
+import os
 import sys
-from collections import deque
+import time
+from collections import Counter, OrderedDict, defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 
 from utils import *
 
@@ -38,6 +44,31 @@ class Problem:
         self.actions(state)."""
         raise NotImplementedError
 
+    def apply(self, state, action):
+        """Execute the given action on the given state in place and return a
+        token that self.undo accepts to restore the previous state. Only
+        needed by the searches that keep a single state, such as
+        depth_first_backtracking_search."""
+        raise NotImplementedError
+
+    def undo(self, state, token):
+        """Revert, in place, the action whose self.apply returned token."""
+        raise NotImplementedError
+
+    def refutes(self, actions):
+        """Return True if no goal can be reached by a path that contains all
+        the given actions (in the order given). Returning False when unsure
+        is always safe. Only needed by conflict_directed_search."""
+        return False
+
+    def covers(self, actions, tried):
+        """Return True if every goal reached by a path that contains all the
+        given actions (in the order given) also contains an action of the set
+        tried: after the given actions, every action available is in tried.
+        Returning False when unsure is always safe. Only needed by
+        conflict_directed_search."""
+        return False
+
     def goal_test(self, state):
         """Return True if the state is a goal. The default method compares the
         state to self.goal or checks for state in self.goal if it is a
@@ -72,8 +103,10 @@ class Node:
     the same state. Also includes the action that got us to this state, and
     the total path_cost (also known as g) to reach the node. Other functions
     may add an f and h value; see best_first_graph_search and astar_search for
-    an explanation of how the f and h values are handled. You will not need to
-    subclass this class."""
+    an explanation of how the f and h values are handled. The attributes are
+    fixed __slots__ (f and h included), which keeps large frontiers small."""
+
+    __slots__ = ("state", "parent", "action", "path_cost", "depth", "f", "h")
 
     def __init__(self, state, parent=None, action=None, path_cost=0):
         """Create a search tree Node, derived from a parent by an action."""
@@ -130,6 +163,23 @@ class Node:
         return hash(self.state)
 
 
+class LeanNode(Node):
+    """A Node that does not keep a pointer to its parent, for searches where
+    only the state of the goal node matters: nodes that leave the frontier
+    are freed at once instead of being held by their children. path() and
+    solution() only see the node itself, and heuristics that read
+    node.parent (pathmax) fall back to their plain value."""
+
+    __slots__ = ()
+
+    def child_node(self, problem, action):
+        next_state = problem.result(self.state, action)
+        next_node = LeanNode(next_state, None, action,
+                             problem.path_cost(self.path_cost, self.state, action, next_state))
+        next_node.depth = self.depth + 1
+        return next_node
+
+
 # ______________________________________________________________________________
 
 
@@ -175,7 +225,7 @@ class SimpleProblemSolvingAgentProgram:
 # Uninformed Search algorithms
 
 
-def breadth_first_tree_search(problem):
+def breadth_first_tree_search(problem, node_class=Node):
     """
     [Figure 3.7]
     Search the shallowest nodes in the search tree first.
@@ -184,7 +234,7 @@ def breadth_first_tree_search(problem):
     Repeats infinitely in case of loops.
     """
 
-    frontier = deque([Node(problem.initial)])  # FIFO queue
+    frontier = deque([node_class(problem.initial)])  # FIFO queue
 
     while frontier:
         node = frontier.popleft()
@@ -194,7 +244,7 @@ def breadth_first_tree_search(problem):
     return None
 
 
-def depth_first_tree_search(problem):
+def depth_first_tree_search(problem, node_class=Node):
     """
     [Figure 3.7]
     Search the deepest nodes in the search tree first.
@@ -203,7 +253,7 @@ def depth_first_tree_search(problem):
     Repeats infinitely in case of loops.
     """
 
-    frontier = [Node(problem.initial)]  # Stack
+    frontier = [node_class(problem.initial)]  # Stack
 
     while frontier:
         node = frontier.pop()
@@ -213,6 +263,246 @@ def depth_first_tree_search(problem):
     return None
 
 
+def depth_first_backtracking_search(problem):
+    """
+    Same search order as depth_first_tree_search, but a single state is
+    modified in place with problem.apply and restored with problem.undo
+    when backtracking, so no successor states are created. The frontier
+    is one iterator of remaining actions per level of the current path.
+    problem.initial is left in the goal state when a solution is found;
+    every node in the returned path refers to that same state object.
+    """
+
+    state = problem.initial
+    node = Node(state)
+    if problem.goal_test(state):
+        return node
+
+    path = []  # (action, undo token) from the root to the current state
+    frontier = [reversed(list(problem.actions(state)))]  # Stack
+    while frontier:
+        action = next(frontier[-1], None)
+        if action is None:
+            frontier.pop()
+            if path:
+                problem.undo(state, path.pop()[1])
+            continue
+
+        path.append((action, problem.apply(state, action)))
+        if problem.goal_test(state):
+            for action, _ in path:
+                node = Node(state, node, action, problem.path_cost(node.path_cost, state, action, state))
+            return node
+        frontier.append(reversed(list(problem.actions(state))))
+    return None
+
+
+def depth_first_tree_solutions(problem, key=None):
+    """
+    Yield every goal node, in the order depth_first_tree_search visits
+    them; the search only goes on when the next solution is asked for.
+    When key is given, key(state) must identify states with the same
+    subtree: subtrees found to hold no goal are remembered by their key and
+    not searched again when the same state comes up on another path.
+    """
+
+    failed = set()
+
+    def explore(node):
+        if problem.goal_test(node.state):
+            yield node
+            return True
+        found = False
+        for action in reversed(list(problem.actions(node.state))):
+            child = node.child_node(problem, action)
+            child_key = key(child.state) if key else None
+            if child_key is not None and child_key in failed:
+                continue
+            if (yield from explore(child)):
+                found = True
+            elif child_key is not None:
+                failed.add(child_key)
+        return found
+
+    yield from explore(Node(problem.initial))
+
+
+def conflict_directed_search(problem, cache_size=1000):
+    """
+    Depth-first tree search with conflict-directed backjumping and nogood
+    learning. At a dead end (no actions and not a goal) the actions of the
+    path are reduced, latest first, to a subset that problem.refutes still
+    rejects: that subset is the conflict. When the conflict does not contain
+    the action that led to a node, the node fails on its own and the search
+    jumps straight back to the latest action in the conflict. When every
+    child fails because of its own action, the conflict of the node is the
+    union of the conflicts of its children without their actions, provided
+    problem.covers confirms that those actions leave no other child (the
+    actions of a node depend on the whole path); otherwise it is the whole
+    path, which is not learned. Conflicts are kept as nogoods in a least recently used cache of
+    cache_size entries, and a child is not generated when its path contains
+    a cached nogood.
+    """
+
+    nogoods = OrderedDict()
+    containing = {}  # action -> cached nogoods that contain it
+
+    def learn(conflict):
+        nogood = frozenset(conflict)
+        if nogood in nogoods:
+            nogoods.move_to_end(nogood)
+            return
+        nogoods[nogood] = None
+        for action in nogood:
+            containing.setdefault(action, set()).add(nogood)
+        if len(nogoods) > cache_size:
+            old, _ = nogoods.popitem(last=False)
+            for action in old:
+                containing[action].discard(old)
+
+    def cached_nogood(path, action):
+        for nogood in containing.get(action, ()):
+            if nogood <= path:
+                nogoods.move_to_end(nogood)
+                return nogood
+        return None
+
+    def dead_end(path):
+        if not problem.refutes(path):
+            return set(path)
+        conflict = list(path)
+        for action in reversed(path):
+            trial = [other for other in conflict if other != action]
+            if problem.refutes(trial):
+                conflict = trial
+        learn(conflict)
+        return set(conflict)
+
+    def exhausted(path, tried, conflicts):
+        conflict = [action for action in path if action in conflicts]
+        if not problem.covers(conflict, tried):
+            return set(path)
+        learn(conflict)
+        return set(conflict)
+
+    def search(node, path):
+        """Return (goal node, None), or (None, conflict) when the subtree has no goal."""
+        if problem.goal_test(node.state):
+            return node, None
+        actions = list(problem.actions(node.state))
+        if not actions:
+            return None, dead_end(path)
+        path_set = set(path)
+        conflicts = set()
+        for action in reversed(actions):  # same order as depth_first_tree_search
+            path_set.add(action)
+            conflict = cached_nogood(path_set, action)
+            path_set.discard(action)
+            if conflict is None:
+                goal, conflict = search(node.child_node(problem, action), path + [action])
+                if goal is not None:
+                    return goal, None
+            if action not in conflict:
+                return None, conflict
+            conflicts |= conflict
+        conflicts -= set(actions)
+        return None, exhausted(path, set(actions), conflicts)
+
+    return search(Node(problem.initial), [])[0]
+
+
+# Per-process state of the parallel_depth_first_search workers, set by _init_search_worker.
+_worker_problem = None
+_worker_found = None
+
+
+def _init_search_worker(problem, found):
+    global _worker_problem, _worker_found
+    _worker_problem = problem
+    _worker_found = found
+
+
+def _search_subtree(frontier, budget):
+    """Depth-first search, in a worker, from a stack of (state, actions)
+    pairs, where actions is the path from the root as nested (action, rest)
+    pairs. Stop after expanding budget nodes, or as soon as any worker has
+    found a goal. Return the actions leading to a goal (or None) and the
+    part of the frontier left to explore, in stack order."""
+    problem, found = _worker_problem, _worker_found
+    expanded = 0
+    while frontier:
+        # the shared flag takes a lock, so it is only checked now and then
+        if expanded % 64 == 0 and found.is_set():
+            return None, []
+        if expanded >= budget:
+            return None, frontier
+        state, actions = frontier.pop()
+        if problem.goal_test(state):
+            found.set()
+            return actions, []
+        expanded += 1
+        frontier.extend((problem.result(state, action), (action, actions))
+                        for action in problem.actions(state))
+    return None, []
+
+
+def parallel_depth_first_search(problem, workers=None, budget=1000):
+    """
+    Depth-first tree search split across a pool of worker processes.
+    The top levels of the tree are expanded breadth-first until there are
+    a few subtrees per worker; each task then explores a subtree
+    depth-first for at most budget nodes and hands back what it did not
+    explore, which is pushed on the shared stack and re-split among the
+    idle workers. A flag shared by all workers stops them as soon as one
+    finds a goal. The problem and its states must be picklable.
+    The returned path is rebuilt in this process by replaying the actions.
+    """
+
+    workers = workers or os.cpu_count() or 1
+    tasks = deque([(problem.initial, None)])
+    while tasks and len(tasks) < 2 * workers:
+        state, actions = tasks.popleft()
+        if problem.goal_test(state):
+            return _replay_actions(problem, actions)
+        tasks.extend((problem.result(state, action), (action, actions))
+                     for action in problem.actions(state))
+
+    # the top of the stack is the task depth_first_tree_search would explore first
+    stack = [[task] for task in tasks]
+    found = multiprocessing.Event()
+    with ProcessPoolExecutor(workers, initializer=_init_search_worker, initargs=(problem, found)) as executor:
+        running = set()
+        while stack or running:
+            while stack and len(running) < workers:
+                running.add(executor.submit(_search_subtree, stack.pop(), budget))
+            done, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                actions, rest = future.result()
+                if actions is not None:
+                    for other in running:
+                        other.cancel()
+                    return _replay_actions(problem, actions)
+                # split what is left so that idle workers can take part of it
+                if len(rest) > 1 and len(stack) + len(running) < workers:
+                    middle = len(rest) // 2
+                    stack.append(rest[:middle])
+                    stack.append(rest[middle:])
+                elif rest:
+                    stack.append(rest)
+    return None
+
+
+def _replay_actions(problem, actions):
+    path = []
+    while actions is not None:
+        action, actions = actions
+        path.append(action)
+    node = Node(problem.initial)
+    for action in reversed(path):
+        node = node.child_node(problem, action)
+    return node
+
+
 def depth_first_graph_search(problem):
     """
     [Figure 3.7]
@@ -257,7 +547,7 @@ def breadth_first_graph_search(problem):
     return None
 
 
-def best_first_graph_search(problem, f, display=False):
+def best_first_graph_search(problem, f, display=False, node_class=Node):
     """Search the nodes with the lowest f scores first.
     You specify the function f(node) that you want to minimize; for example,
     if f is a heuristic estimate to the goal, then we have greedy best
@@ -266,7 +556,7 @@ def best_first_graph_search(problem, f, display=False):
     values will be cached on the nodes as they are computed. So after doing
     a best first search you can examine the f values of the path returned."""
     f = memoize(f, 'f')
-    node = Node(problem.initial)
+    node = node_class(problem.initial)
     frontier = PriorityQueue('min', f)
     frontier.append(node)
     explored = set()
@@ -287,9 +577,9 @@ def best_first_graph_search(problem, f, display=False):
     return None
 
 
-def uniform_cost_search(problem, display=False):
+def uniform_cost_search(problem, display=False, node_class=Node):
     """[Figure 3.14]"""
-    return best_first_graph_search(problem, lambda node: node.path_cost, display)
+    return best_first_graph_search(problem, lambda node: node.path_cost, display, node_class)
 
 
 def depth_limited_search(problem, limit=50):
@@ -410,17 +700,17 @@ greedy_best_first_graph_search = best_first_graph_search
 
 
 # Greedy best-first search is accomplished by specifying f(n) = h(n).
-def greedy_search(problem, h=None):
+def greedy_search(problem, h=None, node_class=Node):
     """f(n) = h(n)"""
     h = memoize(h or problem.h, 'h')
-    return best_first_graph_search(problem, h)
+    return best_first_graph_search(problem, h, node_class=node_class)
 
-def astar_search(problem, h=None, display=False):
+def astar_search(problem, h=None, display=False, node_class=Node):
     """A* search is best-first graph search with f(n) = g(n)+h(n).
     You need to specify the h function when you call astar_search, or
     else in your Problem subclass."""
     h = memoize(h or problem.h, 'h')
-    return best_first_graph_search(problem, lambda n: n.path_cost + h(n), display)
+    return best_first_graph_search(problem, lambda n: n.path_cost + h(n), display, node_class)
 
 
 # ______________________________________________________________________________
@@ -603,7 +893,7 @@ class PlanRoute(Problem):
 # Other search algorithms
 
 
-def recursive_best_first_search(problem, h=None):
+def recursive_best_first_search(problem, h=None, node_class=Node):
     """[Figure 3.26]"""
     h = memoize(h or problem.h, 'h')
 
@@ -629,7 +919,7 @@ def recursive_best_first_search(problem, h=None):
             if result is not None:
                 return result, best.f
 
-    node = Node(problem.initial)
+    node = node_class(problem.initial)
     node.f = h(node)
     result, bestf = RBFS(problem, node, np.inf)
     return result
@@ -1533,6 +1823,19 @@ class InstrumentedProblem(Problem):
         self.states += 1
         return self.problem.result(state, action)
 
+    def apply(self, state, action):
+        self.states += 1
+        return self.problem.apply(state, action)
+
+    def undo(self, state, token):
+        return self.problem.undo(state, token)
+
+    def refutes(self, actions):
+        return self.problem.refutes(actions)
+
+    def covers(self, actions, tried):
+        return self.problem.covers(actions, tried)
+
     def goal_test(self, state):
         self.goal_tests += 1
         result = self.problem.goal_test(state)
@@ -1554,6 +1857,139 @@ class InstrumentedProblem(Problem):
                                                self.states, str(self.found)[:4])
 
 
+class TelemetryProblem(InstrumentedProblem):
+    """An InstrumentedProblem that also records where the time goes: wall
+    time in actions, result, goal_test and h (apply and undo for the
+    searches that keep a single state), nodes expanded per depth, a
+    histogram of the branching factor, the peak frontier size and the
+    nodes expanded per second. Only counters are kept; with sample=n just
+    one call in n of each method is timed, and the totals are scaled up.
+    The peak frontier is estimated as the states generated minus the states
+    goal-tested, which is exact for the tree searches. The depth of a state
+    is kept from the moment it is generated until it is expanded, and then
+    on a stack of expanded states until a state at the same depth or above
+    is expanded, so a state expanded again after that
+    (recursive_best_first_search) counts at depth 0."""
+
+    def __init__(self, problem, sample=1):
+        super().__init__(problem)
+        self.sample = sample
+        self.calls = Counter()
+        self.timed_calls = Counter()
+        self.times = defaultdict(float)
+        self.depths = Counter()
+        self.branching = Counter()
+        self.depth_of = {id(problem.initial): 0}  # depth of each state not yet expanded
+        self.expanded = []  # (id, depth) of the expanded states on the current path
+        self.trail_depth = None  # depth of the single state, once apply is used
+        self.frontier = self.peak_frontier = 1
+        self.start = time.perf_counter()
+        self.end = None
+
+    def timed(self, name, fn, *args):
+        count = self.calls[name]
+        self.calls[name] = count + 1
+        if count % self.sample:
+            return fn(*args)
+        start = time.perf_counter()
+        value = fn(*args)
+        self.times[name] += time.perf_counter() - start
+        self.timed_calls[name] += 1
+        return value
+
+    def depth(self, state):
+        if self.trail_depth is not None:
+            return self.trail_depth
+        key = id(state)
+        for expanded, depth in reversed(self.expanded):
+            if expanded == key:
+                return depth
+        return self.depth_of.get(key, 0)
+
+    def actions(self, state):
+        self.succs += 1
+        actions = list(self.timed("actions", self.problem.actions, state))
+        if self.trail_depth is None:
+            depth = self.depth_of.pop(id(state), None)
+            if depth is None:
+                depth = self.depth(state)
+            while self.expanded and self.expanded[-1][1] >= depth:
+                self.expanded.pop()
+            self.expanded.append((id(state), depth))
+        self.depths[self.depth(state)] += 1
+        self.branching[len(actions)] += 1
+        return actions
+
+    def result(self, state, action):
+        self.states += 1
+        child = self.timed("result", self.problem.result, state, action)
+        self.depth_of[id(child)] = self.depth(state) + 1
+        self.frontier += 1
+        self.peak_frontier = max(self.peak_frontier, self.frontier)
+        return child
+
+    def apply(self, state, action):
+        self.states += 1
+        if self.trail_depth is None:
+            self.trail_depth = 0
+        self.trail_depth += 1
+        self.peak_frontier = max(self.peak_frontier, self.trail_depth + 1)
+        return self.timed("apply", self.problem.apply, state, action)
+
+    def undo(self, state, token):
+        self.trail_depth -= 1
+        return self.timed("undo", self.problem.undo, state, token)
+
+    def goal_test(self, state):
+        self.frontier -= 1
+        return self.timed("goal_test", super().goal_test, state)
+
+    def h(self, node):
+        return self.timed("h", self.problem.h, node)
+
+    def refutes(self, actions):
+        return self.timed("refutes", self.problem.refutes, actions)
+
+    def covers(self, actions, tried):
+        return self.timed("covers", self.problem.covers, actions, tried)
+
+    def stop(self):
+        """Mark the end of the run (otherwise the report uses the current time)."""
+        self.end = time.perf_counter()
+
+    def report(self):
+        """Return the statistics of the run as a dict."""
+        elapsed = (self.end or time.perf_counter()) - self.start
+        times = {name: self.times[name] * self.calls[name] / self.timed_calls[name]
+                 for name in self.calls if self.timed_calls[name]}
+        return {
+            "expanded": self.succs,
+            "generated": self.states,
+            "goal_tests": self.goal_tests,
+            "elapsed": elapsed,
+            "nodes_per_second": self.succs / elapsed if elapsed else 0.0,
+            "peak_frontier": self.peak_frontier,
+            "calls": dict(self.calls),
+            "times": times,
+            "nodes_per_depth": dict(sorted(self.depths.items())),
+            "branching": dict(sorted(self.branching.items())),
+        }
+
+    def write_json(self, file):
+        json.dump(self.report(), file, indent=2)
+
+    def write_csv(self, file):
+        """One row per value: section, key, value (key is empty for the totals)."""
+        writer = csv.writer(file)
+        writer.writerow(["section", "key", "value"])
+        for section, value in self.report().items():
+            if isinstance(value, dict):
+                for key, item in value.items():
+                    writer.writerow([section, key, item])
+            else:
+                writer.writerow([section, "", value])
+
+
 def compare_searchers(problems, header,
                       searchers=[breadth_first_tree_search,
                                  breadth_first_graph_search,